@@ -1,25 +1,38 @@
 #!/usr/bin/env python3
 """BeatWake CLI - Headless alarm manager"""
 
-import json
 import os
 import sys
 import time
+import uuid
 import webbrowser
+import sqlite3
 import subprocess
+import threading
 from datetime import datetime, timedelta
+from alarm_io import TIME_RE, detect_format, export_alarms, import_alarms
+import alarm_store
+from alarm_table import DEFAULT_ACCOUNT, is_valid_account, load_table
+from audio import AudioPlayer
+from coordination import Coordinator
+from dispatcher import get_dispatcher
+from fire_journal import FireJournal, PATH_BROWSER, PATH_SOUND, PATH_SPOTIFY, SCHEDULED_FORMAT
+from spotify_auth import extract_track_uri
+from spotify_uri import MetadataCache
+from tenants import SpotifyAuthPool
+from volume_ramp import DEFAULT_RAMP, RampScheduler, ramp_volume
 
 PERSIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alarms.json")
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alarms.bwt")
+SPOTIFY_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spotify_config.json")
+ACCOUNTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spotify_accounts")
+AUDIO_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_config.json")
+METADATA_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spotify_metadata.json")
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history")
+PREFETCH_MINUTES = 15  # fetch metadata for alarms firing this soon
 
 def load_alarms():
-    if os.path.exists(PERSIST_PATH):
-        with open(PERSIST_PATH, "r") as f:
-            return json.load(f)
-    return []
-
-def save_alarms(alarms):
-    with open(PERSIST_PATH, "w") as f:
-        json.dump(alarms, f, indent=2)
+    return alarm_store.load_alarms(PERSIST_PATH)
 
 def list_alarms():
     alarms = load_alarms()
@@ -27,20 +40,36 @@ def list_alarms():
         print("No alarms set.")
         return
     
+    metadata_cache = MetadataCache(METADATA_CACHE_PATH)
     print("\n📋 Current Alarms:")
     print("-" * 80)
     for i, alarm in enumerate(alarms, 1):
         status = "✓" if alarm.get("enabled", True) else "✗"
         label = f"[{alarm.get('label', '')}] " if alarm.get('label') else ""
-        print(f"{i}. {status} {alarm['time_str']} | {label}{', '.join(alarm['repeat_days'])}")
-        print(f"   URL: {alarm['url']}")
+        account = alarm.get("account") or DEFAULT_ACCOUNT
+        owner = f" | @{account}" if account != DEFAULT_ACCOUNT else ""
+        print(f"{i}. {status} {alarm['time_str']} | {label}{', '.join(alarm['repeat_days'])}{owner}")
+        metadata = metadata_cache.get(extract_track_uri(alarm["url"]) or "")
+        name = f"  ♪ {metadata['name']}" if metadata and metadata.get("name") else ""
+        print(f"   URL: {alarm['url']}{name}")
     print("-" * 80)
 
 def add_alarm_interactive():
     print("\n➕ Add New Alarm")
     time_str = input("Time (HH:MM): ").strip()
+    match = TIME_RE.match(time_str)
+    if not match:
+        print(f"❌ Invalid time: {time_str} (use HH:MM, 24-hour)")
+        return
+    time_str = f"{int(match.group(1)):02d}:{match.group(2)}"
     label = input("Label (optional): ").strip()
     url = input("Spotify URL: ").strip()
+    account = input(f"Account (default: {DEFAULT_ACCOUNT}): ").strip() or DEFAULT_ACCOUNT
+    if not is_valid_account(account):
+        print(f"❌ Invalid account name: {account}")
+        return
+    device = input("Spotify device name (optional): ").strip()
+    ramp_minutes = input("Volume ramp minutes (optional, e.g. 5): ").strip()
     
     print("\nRepeat days (comma-separated): Mon,Tue,Wed,Thu,Fri,Sat,Sun")
     days_input = input("Or type 'Once': ").strip()
@@ -53,16 +82,18 @@ def add_alarm_interactive():
         repeat_days = [day_map[d.lower()] for d in days_input.split(",") if d.lower() in day_map]
     
     alarm = {
+        "id": uuid.uuid4().hex,
         "time_str": time_str,
         "url": url,
         "repeat_days": repeat_days,
         "enabled": True,
-        "label": label
+        "label": label,
+        "account": account,
+        "device": device,
+        "ramp": dict(DEFAULT_RAMP, seconds=int(float(ramp_minutes) * 60)) if ramp_minutes else None
     }
     
-    alarms = load_alarms()
-    alarms.append(alarm)
-    save_alarms(alarms)
+    alarm_store.update_alarms(PERSIST_PATH, lambda alarms: alarms + [alarm])
     print(f"✅ Alarm added: {label or time_str}")
 
 def delete_alarm():
@@ -75,57 +106,262 @@ def delete_alarm():
     try:
         idx = int(input("\nEnter alarm number to delete: ")) - 1
         if 0 <= idx < len(alarms):
-            deleted = alarms.pop(idx)
-            save_alarms(alarms)
+            deleted = alarms[idx]
+            # Delete by id: other processes may have changed the store meanwhile
+            alarm_store.update_alarms(
+                PERSIST_PATH, lambda current: [a for a in current if a["id"] != deleted["id"]])
             print(f"✅ Deleted alarm: {deleted.get('label', deleted['time_str'])}")
         else:
             print("❌ Invalid alarm number")
     except ValueError:
         print("❌ Invalid input")
 
-def run_daemon():
+def parse_options(args):
+    """Split "--name value" pairs from positional arguments"""
+    options, positional = {}, []
+    it = iter(args)
+    for arg in it:
+        if arg.startswith("--"):
+            options[arg] = next(it, None)
+        else:
+            positional.append(arg)
+    return options, positional
+
+def import_file(path, fmt=None, chunk_size=None):
+    def on_error(error):
+        print(f"   ❌ {error}")
+    
+    def on_chunk(imported, failed):
+        print(f"   ... {imported} imported, {failed} rejected")
+    
+    try:
+        imported, failed = import_alarms(path, PERSIST_PATH, fmt=fmt,
+                                         chunk_size=int(chunk_size or 1000),
+                                         on_error=on_error, on_chunk=on_chunk)
+    except (OSError, ValueError) as e:
+        print(f"❌ Import failed: {e}")
+        sys.exit(1)
+    print(f"✅ Imported {imported} alarms ({failed} rejected)")
+
+def export_file(path, fmt=None):
+    fmt = detect_format(path, fmt) if path != "-" else (fmt or "jsonl")
+    table = load_table(PERSIST_PATH, SNAPSHOT_PATH)
+    rows = (table.row(i) for i in range(len(table)))
+    if path == "-":
+        export_alarms(rows, sys.stdout, fmt)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        export_alarms(rows, out, fmt)
+    print(f"✅ Exported {len(table)} alarms to {path}")
+
+def open_url(url):
+    try:
+        # Try to open in browser using $BROWSER
+        result = subprocess.run([os.environ.get("BROWSER", "xdg-open"), url])
+        return result.returncode == 0
+    except:
+        print(f"   URL: {url}")
+        return False
+
+def fire_alarm(alarm, scheduled, auth_pool, audio_player, ramps, metadata_cache, journal):
+    """Play an alarm on Spotify, falling back to the browser, then a local sound"""
+    account = alarm.get("account") or DEFAULT_ACCOUNT
+    label = alarm.get("label") or alarm["time_str"]
+    track_uri = extract_track_uri(alarm["url"])
+    error = None
+    try:
+        auth = auth_pool.get(account)
+    except ValueError as e:
+        auth, error = None, str(e)
+        print(f"   {e}, skipping the API")
+    if auth is not None and track_uri and not metadata_cache.is_playable(track_uri, account):
+        error = "not playable on Spotify"
+        print("   Not playable on Spotify, skipping the API")
+    elif auth is not None and track_uri and auth.is_authenticated():
+        # Start quiet when ramping, instead of at the device's last volume
+        volume = ramp_volume(alarm["ramp"], 0) if alarm.get("ramp") else None
+        if auth.play_on_device(track_uri, alarm.get("device"), volume):
+            print(f"   Playing on Spotify (@{account})")
+            if alarm.get("ramp"):
+                device = auth.pick_device(alarm.get("device"))
+                ramps.start(alarm["id"], auth, alarm["ramp"], device_id=device["id"] if device else None,
+                            label=label)
+            journal.record(alarm["id"], scheduled, PATH_SPOTIFY, label=label, account=account)
+            return
+        error = "Spotify playback failed"
+    if open_url(alarm["url"]):
+        journal.record(alarm["id"], scheduled, PATH_BROWSER, label=label, account=account, error=error)
+    else:
+        print("   Playing local alarm sound")
+        audio_player.play_fallback()
+        journal.record(alarm["id"], scheduled, PATH_SOUND, label=label, account=account,
+                       error=error or "no browser")
+
+def prefetch_metadata(items, auth_pool, metadata_cache):
+    """Refresh cached metadata for (url, account) pairs about to fire"""
+    for url, account in items:
+        uri = extract_track_uri(url)
+        if uri and is_valid_account(account) and not metadata_cache.is_fresh(uri, account):
+            metadata_cache.lookup(auth_pool.get(account), uri, account)
+    metadata_cache.save()
+
+def remove_fired_once(alarm_ids):
+    """Drop fired one-time alarms from the shared store.
+
+    Runs on the dispatcher: the store lock can be held for a whole bulk
+    import, and the scheduler loop must keep ticking meanwhile.
+    """
+    try:
+        alarm_store.update_alarms(PERSIST_PATH, lambda alarms: [a for a in alarms if a["id"] not in alarm_ids])
+    except (OSError, ValueError) as e:
+        print(f"Error removing one-time alarms: {e}")
+
+def run_daemon(coord_path=None, node_id=None):
     print("🚀 BeatWake daemon started. Press Ctrl+C to stop.")
     print("Monitoring alarms...")
     
-    alarms = load_alarms()
+    table = load_table(PERSIST_PATH, SNAPSHOT_PATH)
+    table_mtime = os.path.getmtime(PERSIST_PATH) if os.path.exists(PERSIST_PATH) else None
+    auth_pool = SpotifyAuthPool(ACCOUNTS_DIR, default_config_path=SPOTIFY_CONFIG_PATH)
+    dispatcher = get_dispatcher()
+    audio_player = AudioPlayer(AUDIO_CONFIG_PATH)
+    dispatcher.submit(audio_player.preload)
+    ramps = RampScheduler(dispatcher)
+    metadata_cache = MetadataCache(METADATA_CACHE_PATH)
+    journal = FireJournal(HISTORY_DIR)
     last_check = {}
     
+    coordinator = None
+    if coord_path:
+        coordinator = Coordinator(coord_path, node_id=node_id)
+        coordinator.start()
+        print(f"Coordinating as node {coordinator.node_id} via {coord_path}")
+    
     try:
         while True:
+            # Pick up edits made by other nodes or the CLI
+            mtime = os.path.getmtime(PERSIST_PATH) if os.path.exists(PERSIST_PATH) else None
+            if mtime != table_mtime:
+                table.close()
+                table = load_table(PERSIST_PATH, SNAPSHOT_PATH)
+                table_mtime = mtime
+            
             now = datetime.now()
-            now_str = now.strftime("%H:%M")
-            weekday = now.strftime("%A")
+            minute_key = now.strftime(SCHEDULED_FORMAT)
+            fired_once = set()
             
-            for i, alarm in enumerate(alarms):
-                if not alarm.get("enabled", True):
+            for i in table.due_now(now):
+                aid = table.alarm_id(i)
+                check_key = f"{aid}_{minute_key}"
+                if check_key in last_check:
                     continue
-                
-                if alarm["time_str"] == now_str:
-                    check_key = f"{i}_{now.strftime('%Y-%m-%d %H:%M')}"
-                    if check_key in last_check:
+                if coordinator and not coordinator.owns(aid):
+                    continue  # Another node's shard
+                if coordinator:
+                    try:
+                        claimed = coordinator.claim_fire(aid, minute_key)
+                    except sqlite3.Error as e:
+                        # Leave last_check unset so the claim is retried next tick
+                        print(f"Error claiming alarm {aid}: {e}")
                         continue
-                    
-                    if "Once" in alarm["repeat_days"] or weekday in alarm["repeat_days"]:
-                        print(f"\n🔔 ALARM: {alarm.get('label', alarm['time_str'])}")
-                        try:
-                            # Try to open in browser using $BROWSER
-                            subprocess.run([os.environ.get("BROWSER", "xdg-open"), alarm["url"]])
-                        except:
-                            print(f"   URL: {alarm['url']}")
-                        
+                    if not claimed:
                         last_check[check_key] = True
-                        
-                        # Remove "Once" alarms
-                        if "Once" in alarm["repeat_days"]:
-                            alarms.pop(i)
-                            save_alarms(alarms)
-                            print("   (One-time alarm removed)")
+                        continue  # Another node already fired it
+                last_check[check_key] = True
+                
+                alarm = table.row(i)
+                print(f"\n🔔 ALARM: {alarm.get('label') or alarm['time_str']}")
+                dispatcher.submit(fire_alarm, alarm, minute_key, auth_pool, audio_player, ramps,
+                                  metadata_cache, journal)
+                
+                if "Once" in alarm["repeat_days"]:
+                    fired_once.add(aid)
+            
+            # Remove "Once" alarms
+            if fired_once:
+                dispatcher.submit(remove_fired_once, fired_once)
+                print("   (One-time alarm will be removed)")
             
+            # Only this minute's keys can still match
+            last_check = {k: v for k, v in last_check.items() if k.endswith(minute_key)}
+            auth_pool.evict_idle()
+            upcoming = {(table.urls[table.url_idx[i]], table.account(i))
+                        for i, minutes in enumerate(table.next_fire(now))
+                        if 0 <= minutes <= PREFETCH_MINUTES
+                        and (not coordinator or coordinator.owns(table.alarm_id(i)))}
+            # Warm device lists of accounts about to fire, so firing needs no lookup
+            auth_pool.refresh_stale_devices(dispatcher, {account for _, account in upcoming})
+            if upcoming:
+                dispatcher.submit(prefetch_metadata, upcoming, auth_pool, metadata_cache)
             time.sleep(30)  # Check every 30 seconds
             
     except KeyboardInterrupt:
+        dispatcher.shutdown(wait=False)
+        audio_player.close()
+        journal.close()
+        if coordinator:
+            coordinator.stop()
         print("\n\n👋 BeatWake daemon stopped.")
 
+def show_history(days=7, alarm=None, limit=50):
+    journal = FireJournal(HISTORY_DIR)
+    start_day = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    entries = journal.query(start_day=start_day, alarm_id=alarm, limit=limit)
+    journal.close()
+    if not entries:
+        print("No alarm fires recorded.")
+        return
+    
+    print(f"\n📜 Alarm History (last {days} days):")
+    print("-" * 80)
+    for entry in entries:
+        actual = entry["actual"].replace("T", " ")
+        line = f"{actual} | {entry['path']:<8} | {entry.get('label') or entry['alarm_id']}"
+        if entry["scheduled"] and not actual.startswith(entry["scheduled"]):
+            line += f" (scheduled {entry['scheduled']})"
+        if entry.get("error"):
+            line += f" ⚠️ {entry['error']}"
+        print(line)
+    print("-" * 80)
+
+def login_accounts(accounts, timeout=300):
+    """Log in to Spotify for several accounts at once, one browser tab each"""
+    os.makedirs(ACCOUNTS_DIR, exist_ok=True)
+    auth_pool = SpotifyAuthPool(ACCOUNTS_DIR, default_config_path=SPOTIFY_CONFIG_PATH)
+    results = {}
+    changed = threading.Condition()
+    
+    def finished(account):
+        def callback(success):
+            with changed:
+                results[account] = success
+                changed.notify_all()
+            print(f"{'✅' if success else '❌'} {account}: {'connected' if success else 'login failed'}")
+        return callback
+    
+    started = []
+    for account in accounts:
+        if not is_valid_account(account):
+            print(f"❌ {account}: invalid account name")
+            continue
+        auth = auth_pool.get(account)
+        if not auth.client_id:
+            print(f"❌ {account}: no Spotify client credentials; set them in the GUI first")
+            continue
+        started.append(account)
+        url = auth.start_auth_flow(finished(account), timeout=timeout)
+        if url is None:
+            started.remove(account)
+            print(f"❌ {account}: could not start login")
+        else:
+            print(f"🔗 {account}: {url}")
+    
+    if not started:
+        return
+    print(f"\nWaiting for {len(started)} login(s)...")
+    with changed:
+        changed.wait_for(lambda: all(account in results for account in started), timeout + 5)
+
 def main():
     if len(sys.argv) < 2:
         print("BeatWake CLI - Headless Alarm Manager")
@@ -134,6 +370,14 @@ def main():
         print("  python BeatWake-CLI.py add           - Add new alarm (interactive)")
         print("  python BeatWake-CLI.py delete        - Delete an alarm")
         print("  python BeatWake-CLI.py daemon        - Run alarm daemon")
+        print("      [--coord DB] [--node NAME]       - Share alarms with other daemons via SQLite DB")
+        print("  python BeatWake-CLI.py import FILE   - Import alarms from .csv, .jsonl or .ics")
+        print("      [--format FMT] [--chunk N]")
+        print("  python BeatWake-CLI.py export FILE   - Export alarms (FILE '-' for stdout)")
+        print("      [--format FMT]")
+        print("  python BeatWake-CLI.py history       - Show recent alarm fires")
+        print("      [--days N] [--alarm ID] [--limit N]")
+        print("  python BeatWake-CLI.py login [ACCOUNT ...] - Connect Spotify accounts")
         print("\nFor GUI version, use: xvfb-run python BeatWake-SourceCode.py")
         sys.exit(1)
     
@@ -146,7 +390,24 @@ def main():
     elif command == "delete":
         delete_alarm()
     elif command == "daemon":
-        run_daemon()
+        options, _ = parse_options(sys.argv[2:])
+        run_daemon(coord_path=options.get("--coord") or os.environ.get("BEATWAKE_COORD_DB"),
+                   node_id=options.get("--node"))
+    elif command in ("import", "export"):
+        options, positional = parse_options(sys.argv[2:])
+        if not positional:
+            print(f"Usage: python BeatWake-CLI.py {command} FILE [--format csv|jsonl|ics]")
+            sys.exit(1)
+        if command == "import":
+            import_file(positional[0], options.get("--format"), options.get("--chunk"))
+        else:
+            export_file(positional[0], options.get("--format"))
+    elif command == "history":
+        options, _ = parse_options(sys.argv[2:])
+        show_history(days=int(options.get("--days") or 7), alarm=options.get("--alarm"),
+                     limit=int(options.get("--limit") or 50))
+    elif command == "login":
+        login_accounts(sys.argv[2:] or [DEFAULT_ACCOUNT])
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)
@@ -5,19 +5,31 @@ import time
 import threading
 import webbrowser
 from ttkthemes import ThemedTk
-import json
 import os
-import subprocess
-from spotify_auth import SpotifyAuth
+import uuid
+import alarm_store
+from alarm_table import alarm_id, is_valid_account
+from audio import AudioPlayer
+from dispatcher import get_dispatcher
+from fire_journal import PATH_BROWSER, PATH_SNOOZE, PATH_SOUND, PATH_SPOTIFY, SCHEDULED_FORMAT, FireJournal
+from spotify_auth import extract_track_uri
+from spotify_uri import MetadataCache, resolve
+from tenants import DEFAULT_ACCOUNT, SpotifyAuthPool
+from volume_ramp import DEFAULT_RAMP, RampScheduler, ramp_volume
 
 # === Alarm Class ===
 class Alarm:
-    def __init__(self, time_str, url, repeat_days, enabled=True, label=""):
+    def __init__(self, time_str, url, repeat_days, enabled=True, label="", account=DEFAULT_ACCOUNT,
+                 alarm_id=None, device="", ramp=None):
+        self.id = alarm_id or uuid.uuid4().hex
         self.time_str = time_str
         self.url = url
         self.repeat_days = repeat_days
         self.enabled = enabled
         self.label = label  # optional alarm name
+        self.account = account  # Spotify account that plays this alarm
+        self.device = device  # preferred Spotify device name or id
+        self.ramp = ramp  # volume ramp spec, see volume_ramp.DEFAULT_RAMP
         self._last_fired_key = None
 
     def should_trigger(self):
@@ -34,7 +46,7 @@ class Alarm:
 
     def fire_key_for_now(self):
         # unique key per minute to avoid duplicate triggers in the same minute
-        return datetime.now().strftime("%Y-%m-%d %H:%M")
+        return datetime.now().strftime(SCHEDULED_FORMAT)
 
     def get_next_trigger(self):
         """Calculate next trigger time for display"""
@@ -69,11 +81,15 @@ class Alarm:
 
     def to_dict(self):
         return {
+            "id": self.id,
             "time_str": self.time_str,
             "url": self.url,
             "repeat_days": self.repeat_days,
             "enabled": self.enabled,
             "label": self.label,
+            "account": self.account,
+            "device": self.device,
+            "ramp": self.ramp,
         }
 
     @staticmethod
@@ -83,45 +99,80 @@ class Alarm:
             data["url"], 
             data["repeat_days"],
             data.get("enabled", True),
-            data.get("label", "")
+            data.get("label", ""),
+            data.get("account") or DEFAULT_ACCOUNT,
+            alarm_id(data),
+            data.get("device", ""),
+            data.get("ramp")
         )
 
 alarms = []
 PERSIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alarms.json")
 SPOTIFY_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spotify_config.json")
+ACCOUNTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spotify_accounts")
+AUDIO_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_config.json")
+METADATA_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spotify_metadata.json")
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history")
 snooze_alarms = []
-spotify_auth = SpotifyAuth(SPOTIFY_CONFIG_PATH)
+audio_player = AudioPlayer(AUDIO_CONFIG_PATH)
+metadata_cache = MetadataCache(METADATA_CACHE_PATH)
+fire_journal = FireJournal(HISTORY_DIR)
+auth_pool = SpotifyAuthPool(ACCOUNTS_DIR, default_config_path=SPOTIFY_CONFIG_PATH)
+spotify_auth = auth_pool.get(DEFAULT_ACCOUNT)
+ramp_scheduler = RampScheduler(get_dispatcher(), report=lambda message: update_status(message))
+
+def adopt_alarms(stored):
+    """Replace the in-memory alarms with the store's, keeping fire state by id"""
+    global alarms
+    previous = {a.id: a for a in alarms}
+    fresh = []
+    for data in stored:
+        alarm = Alarm.from_dict(data)
+        if alarm.id in previous:
+            alarm._last_fired_key = previous[alarm.id]._last_fired_key
+        fresh.append(alarm)
+    alarms = fresh
+    update_alarm_listbox()
 
 def load_alarms():
-    global alarms
     try:
         if os.path.exists(PERSIST_PATH):
-            with open(PERSIST_PATH, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-            alarms = [Alarm.from_dict(a) for a in raw]
-            update_alarm_listbox()
+            adopt_alarms(alarm_store.load_alarms(PERSIST_PATH))
     except Exception as e:
         messagebox.showwarning("Load Failed", f"Could not load alarms: {e}")
 
-def save_alarms():
+def change_alarms(change):
+    """Apply change(stored alarm dicts) -> alarm dicts to the store, then reload.
+
+    The store is re-read under its lock, so edits from the CLI, imports
+    and daemons made since the GUI loaded are kept rather than overwritten.
+    """
     try:
-        with open(PERSIST_PATH, "w", encoding="utf-8") as f:
-            json.dump([a.to_dict() for a in alarms], f, indent=2)
+        adopt_alarms(alarm_store.update_alarms(PERSIST_PATH, change))
     except Exception as e:
         messagebox.showwarning("Save Failed", f"Could not save alarms: {e}")
 
 def play_system_beep():
     """Play system beep as backup notification"""
+    audio_player.play("alarm")
+
+def open_in_browser(alarm):
+    """Open the alarm in a browser, playing the local fallback sound if none opens"""
     try:
-        subprocess.run(["paplay", "/usr/share/sounds/freedesktop/stereo/alarm-clock-elapsed.oga"], 
-                      stderr=subprocess.DEVNULL, timeout=1)
-    except:
-        print('\a')  # Terminal beep as last resort
+        if webbrowser.open(alarm.url):
+            return True
+    except Exception as e:
+        update_status(f"Error opening browser: {e}")
+    audio_player.play_fallback()
+    return False
 
 def snooze_alarm(alarm, minutes=5):
     """Snooze alarm for specified minutes"""
     snooze_time = datetime.now() + timedelta(minutes=minutes)
     snooze_alarms.append((snooze_time, alarm))
+    ramp_scheduler.cancel(alarm.id)
+    fire_journal.record(alarm.id, snooze_time.strftime(SCHEDULED_FORMAT), PATH_SNOOZE,
+                        label=alarm.label, account=alarm.account, snoozed=minutes)
     update_status(f"Alarm snoozed for {minutes} minutes")
 
 def alarm_checker():
@@ -135,41 +186,53 @@ def alarm_checker():
                 
                 play_system_beep()
                 
-                # Try Spotify API first, fall back to browser
+                # Try Spotify API first, fall back to browser, then local sound
                 track_uri = extract_track_uri(alarm.url)
-                if track_uri and spotify_auth.is_authenticated():
+                try:
+                    auth = auth_pool.get(alarm.account)
+                except ValueError:
+                    auth = None  # Bad account name: go straight to the browser
+                played = False
+                # Skip the API call for items the cache knows are unplayable
+                if track_uri and auth is not None and auth.is_authenticated() \
+                        and metadata_cache.is_playable(track_uri, alarm.account):
                     try:
-                        if spotify_auth.play_track(track_uri):
-                            update_status(f"Alarm triggered (Spotify API): {alarm.label or alarm.time_str}")
-                        else:
-                            webbrowser.open(alarm.url)
-                            update_status(f"Alarm triggered (Browser): {alarm.label or alarm.time_str}")
-                    except Exception as e:
-                        webbrowser.open(alarm.url)
-                        update_status(f"Alarm triggered (Browser): {alarm.label or alarm.time_str}")
+                        # Start quiet when ramping, instead of at the device's last volume
+                        volume = ramp_volume(alarm.ramp, 0) if alarm.ramp else None
+                        played = auth.play_on_device(track_uri, alarm.device, volume)
+                    except Exception:
+                        played = False
+                if played:
+                    path = PATH_SPOTIFY
+                    update_status(f"Alarm triggered (Spotify API): {alarm.label or alarm.time_str}")
+                    if alarm.ramp:
+                        device = auth.pick_device(alarm.device)
+                        ramp_scheduler.start(alarm.id, auth, alarm.ramp,
+                                             device_id=device["id"] if device else None,
+                                             label=alarm.label or alarm.time_str)
+                elif open_in_browser(alarm):
+                    path = PATH_BROWSER
+                    update_status(f"Alarm triggered (Browser): {alarm.label or alarm.time_str}")
                 else:
-                    try:
-                        webbrowser.open(alarm.url)
-                        update_status(f"Alarm triggered: {alarm.label or alarm.time_str}")
-                    except Exception as e:
-                        update_status(f"Error opening browser: {e}")
+                    path = PATH_SOUND
+                    update_status(f"Alarm triggered (Local sound): {alarm.label or alarm.time_str}")
+                fire_journal.record(alarm.id, key, path, label=alarm.label, account=alarm.account)
                 
                 alarm._last_fired_key = key
                 if "Once" in alarm.repeat_days:
-                    alarms.remove(alarm)
-                    update_alarm_listbox()
-                    save_alarms()
+                    # Off this thread: a bulk import can hold the store lock for a while
+                    threading.Thread(target=change_alarms, daemon=True,
+                                     args=(lambda stored, fired=alarm.id: [a for a in stored if a["id"] != fired],)).start()
         
         # Check snoozed alarms
         now = datetime.now()
         for snooze_time, alarm in list(snooze_alarms):
             if now >= snooze_time:
                 play_system_beep()
-                try:
-                    webbrowser.open(alarm.url)
-                    update_status(f"Snoozed alarm triggered: {alarm.label or alarm.time_str}")
-                except Exception as e:
-                    update_status(f"Error opening browser: {e}")
+                path = PATH_BROWSER if open_in_browser(alarm) else PATH_SOUND
+                update_status(f"Snoozed alarm triggered: {alarm.label or alarm.time_str}")
+                fire_journal.record(alarm.id, snooze_time.strftime(SCHEDULED_FORMAT), path,
+                                    label=alarm.label, account=alarm.account, snoozed=True)
                 snooze_alarms.remove((snooze_time, alarm))
         
         time.sleep(1)
@@ -177,7 +240,7 @@ def alarm_checker():
 # === THEMED GUI ===
 app = ThemedTk(theme="equilux")
 app.title("BeatWake - Spotify Alarm Clock")
-app.geometry("600x500")
+app.geometry("720x550")
 app.configure(bg="#2b2b2b")
 
 # === Styles ===
@@ -209,6 +272,11 @@ url_entry = ttk.Entry(app, width=60)
 url_entry.insert(0, "https://open.spotify.com/track/6habFhsOp2NvshLv26DqMb")
 url_entry.pack()
 
+# === Device Input ===
+ttk.Label(app, text="Spotify Device (optional)").pack(pady=5)
+device_entry = ttk.Combobox(app, width=57)
+device_entry.pack()
+
 # === Repeat Options ===
 ttk.Label(app, text="Repeat").pack(pady=5)
 repeat_frame = ttk.Frame(app)
@@ -218,7 +286,12 @@ for day in repeat_vars:
     ttk.Checkbutton(repeat_frame, text=day, variable=repeat_vars[day]).pack(side="left")
 
 once_var = tk.IntVar()
-ttk.Checkbutton(app, text="Once", variable=once_var).pack(pady=3)
+ramp_var = tk.IntVar()
+options_frame = ttk.Frame(app)
+options_frame.pack(pady=3)
+ttk.Checkbutton(options_frame, text="Once", variable=once_var).pack(side="left", padx=5)
+ttk.Checkbutton(options_frame, text="Gentle wake (volume 10% → 80% over 5 min)",
+                variable=ramp_var).pack(side="left", padx=5)
 
 # === Alarm List Display ===
 ttk.Label(app, text="Alarms List (Double-click to toggle enable/disable)").pack(pady=5)
@@ -251,10 +324,10 @@ def toggle_alarm_enabled(event):
     selected = alarm_listbox.curselection()
     if selected:
         index = selected[0]
-        alarms[index].enabled = not alarms[index].enabled
-        update_alarm_listbox()
-        save_alarms()
-        status = "enabled" if alarms[index].enabled else "disabled"
+        toggled, enabled = alarms[index].id, not alarms[index].enabled
+        change_alarms(lambda stored: [dict(a, enabled=enabled) if a["id"] == toggled else a
+                                      for a in stored])
+        status = "enabled" if enabled else "disabled"
         update_status(f"Alarm {status}")
 
 alarm_listbox.bind("<Double-Button-1>", toggle_alarm_enabled)
@@ -269,6 +342,9 @@ def update_alarm_listbox():
         label = f"[{alarm.label}] " if alarm.label else ""
         next_trigger = alarm.get_next_trigger()
         display = f"{status} {alarm.time_str} | {label}{', '.join(alarm.repeat_days)} | Next: {next_trigger}"
+        metadata = metadata_cache.get(extract_track_uri(alarm.url) or "")
+        if metadata and metadata.get("name"):
+            display += f" | ♪ {metadata['name']}"
         alarm_listbox.insert(tk.END, display)
         
         # Update global alarms list to match sorted order for selection
@@ -278,8 +354,9 @@ def add_alarm():
     alarm_time = f"{hour_var.get().zfill(2)}:{minute_var.get().zfill(2)}"
     url = url_entry.get().strip()
     label = label_entry.get().strip()
+    device = device_entry.get().strip()
     
-    if not url.startswith("https://open.spotify.com"):
+    if resolve(url) is None:
         messagebox.showerror("Invalid URL", "Please enter a valid Spotify link.")
         return
 
@@ -299,10 +376,9 @@ def add_alarm():
         messagebox.showwarning("No Repeat Selected", "Please choose at least one repeat option.")
         return
 
-    new_alarm = Alarm(alarm_time, url, repeat_days, enabled=True, label=label)
-    alarms.append(new_alarm)
-    update_alarm_listbox()
-    save_alarms()
+    ramp = dict(DEFAULT_RAMP) if ramp_var.get() else None
+    new_alarm = Alarm(alarm_time, url, repeat_days, enabled=True, label=label, device=device, ramp=ramp)
+    change_alarms(lambda stored: stored + [new_alarm.to_dict()])
     update_status(f"Alarm added: {label or alarm_time}")
     
     # Clear label entry after adding
@@ -311,14 +387,12 @@ def add_alarm():
 def remove_selected():
     selected = alarm_listbox.curselection()
     if selected:
-        index = selected[0]
-        alarms.pop(index)
-        update_alarm_listbox()
-        save_alarms()
+        removed = alarms[selected[0]].id
+        change_alarms(lambda stored: [a for a in stored if a["id"] != removed])
 
 def test_alarm():
     url = url_entry.get().strip()
-    if not url.startswith("https://open.spotify.com"):
+    if resolve(url) is None:
         messagebox.showerror("Invalid URL", "Please enter a valid Spotify link.")
         return
     webbrowser.open(url)
@@ -342,22 +416,6 @@ def update_status(message):
     timestamp = datetime.now().strftime("%H:%M:%S")
     status_var.set(f"[{timestamp}] {message}")
 
-def extract_track_uri(url):
-    """Extract Spotify URI from URL"""
-    try:
-        if 'track/' in url:
-            track_id = url.split('track/')[1].split('?')[0]
-            return f"spotify:track:{track_id}"
-        elif 'album/' in url:
-            album_id = url.split('album/')[1].split('?')[0]
-            return f"spotify:album:{album_id}"
-        elif 'playlist/' in url:
-            playlist_id = url.split('playlist/')[1].split('?')[0]
-            return f"spotify:playlist:{playlist_id}"
-    except:
-        pass
-    return None
-
 def open_spotify_settings():
     """Open Spotify connection settings dialog"""
     settings_window = tk.Toplevel(app)
@@ -457,6 +515,32 @@ To connect BeatWake to Spotify:
     ttk.Button(btn_frame, text="Close", 
                command=settings_window.destroy).pack(side="left", padx=5)
 
+# === History Window ===
+def open_history():
+    """Show the last week of alarm fires, newest first"""
+    history_window = tk.Toplevel(app)
+    history_window.title("Alarm History")
+    history_window.geometry("560x400")
+    history_window.configure(bg="#2b2b2b")
+
+    ttk.Label(history_window, text="Alarm History (last 7 days)",
+              font=("Segoe UI", 14, "bold")).pack(pady=10)
+
+    history_listbox = tk.Listbox(history_window, bg="#1e1e1e", fg="white", font=("Consolas", 9))
+    history_listbox.pack(padx=10, pady=5, fill="both", expand=True)
+
+    start_day = (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")  # today and the 6 before
+    entries = fire_journal.query(start_day=start_day, limit=200)
+    for entry in entries:
+        when = entry["actual"].replace("T", " ")
+        name = entry.get("label") or entry["alarm_id"][:8]
+        history_listbox.insert(tk.END, f"{when}  {entry['path']:<8} {name}")
+    if not entries:
+        history_listbox.insert(tk.END, "No alarms have fired in the last 7 days.")
+
+    ttk.Button(history_window, text="Close",
+               command=history_window.destroy).pack(pady=10)
+
 # === Buttons ===
 btn_frame = ttk.Frame(app)
 btn_frame.pack(pady=10)
@@ -464,15 +548,32 @@ ttk.Button(btn_frame, text="Add Alarm", width=15, command=add_alarm).pack(side="
 ttk.Button(btn_frame, text="Remove Selected", width=15, command=remove_selected).pack(side="left", padx=5)
 ttk.Button(btn_frame, text="Test Alarm", width=15, command=test_alarm).pack(side="left", padx=5)
 ttk.Button(btn_frame, text="Snooze 5min", width=15, command=lambda: snooze_selected(5)).pack(side="left", padx=5)
+ttk.Button(btn_frame, text="History", width=10, command=open_history).pack(side="left", padx=5)
 
 # === Start Alarm Thread ===
 load_alarms()
+threading.Thread(target=audio_player.preload, daemon=True).start()
 threading.Thread(target=alarm_checker, daemon=True).start()
 update_status("Application started")
 
 # Refresh Spotify status every 30 seconds
+def prefetch_metadata():
+    """Fetch metadata for alarms missing from the cache (runs on the dispatcher)"""
+    fetched = False
+    for alarm in list(alarms):
+        uri = extract_track_uri(alarm.url)
+        if uri and is_valid_account(alarm.account) and not metadata_cache.is_fresh(uri, alarm.account):
+            entry = metadata_cache.lookup(auth_pool.get(alarm.account), uri, alarm.account)
+            fetched = entry is not None or fetched
+    if fetched:
+        metadata_cache.save()
+        app.after(0, update_alarm_listbox)
+
 def refresh_spotify_status():
     update_spotify_status_display()
+    auth_pool.refresh_stale_devices(get_dispatcher(), {a.account for a in alarms if a.enabled})
+    get_dispatcher().submit(prefetch_metadata)
+    device_entry["values"] = [d.get("name") for d in spotify_auth.devices if d.get("name")]
     app.after(30000, refresh_spotify_status)
 
 refresh_spotify_status()
@@ -0,0 +1,428 @@
+"""BeatWake bulk import/export - streams alarms as CSV, JSON Lines or iCalendar"""
+
+import csv
+import json
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+from alarm_store import assign_ids, read_alarms, store_lock
+from alarm_table import DAY_NAMES, DEFAULT_ACCOUNT, is_valid_account
+from spotify_uri import resolve
+from volume_ramp import CURVES, DEFAULT_RAMP
+
+FORMATS = ("csv", "jsonl", "ics")
+CHUNK_SIZE = 1000
+CSV_FIELDS = ["id", "time_str", "url", "repeat_days", "enabled", "label", "account", "device", "ramp"]
+
+TIME_RE = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+SPOTIFY_URL_RE = re.compile(r"https://open\.spotify\.com/\S+")
+
+DAY_ALIASES = {name[:3].lower(): name for name in DAY_NAMES}
+DAY_ALIASES.update({name.lower(): name for name in DAY_NAMES})
+ICS_DAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+
+class RowError(ValueError):
+    """A single input row that could not be imported"""
+
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt.lower()
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    fmt = {"json": "jsonl", "ndjson": "jsonl", "ical": "ics"}.get(ext, ext)
+    if fmt not in FORMATS:
+        raise ValueError(f"Cannot tell the format of {path}; use --format {'|'.join(FORMATS)}")
+    return fmt
+
+
+# --- readers: yield (line number, raw record) ---
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(f):
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, RowError(line_no, f"invalid JSON: {e.msg}")
+
+
+def _unfold_ics(f):
+    """Join RFC 5545 continuation lines, keeping the starting line number"""
+    current, start = None, 0
+    for line_no, line in enumerate(f, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, line_no
+    if current is not None:
+        yield start, current
+
+
+def read_ics(f):
+    event, start = None, 0
+    for line_no, line in _unfold_ics(f):
+        name, _, value = line.partition(":")
+        name, _, params = name.partition(";")
+        name = name.upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event, start = {}, line_no
+        elif name == "END" and value.upper() == "VEVENT" and event is not None:
+            yield start, _event_to_record(start, event)
+            event = None
+        elif event is not None:
+            event[name] = value
+            if name == "DTSTART":
+                event["DTSTART_PARAMS"] = dict(p.split("=", 1) for p in params.split(";") if "=" in p)
+
+
+def _local_start(dtstart, params):
+    """DTSTART as a naive local datetime, converting UTC and TZID times.
+
+    Returns (datetime, day shift caused by the conversion), or raises
+    ValueError for times it can't place.
+    """
+    start = datetime.strptime(dtstart[:15], "%Y%m%dT%H%M%S")
+    tzid = params.get("TZID", "").strip('"')
+    if dtstart.endswith("Z"):
+        zone = timezone.utc
+    elif tzid:
+        if ZoneInfo is None:
+            raise ValueError(f"can't convert TZID {tzid} on this Python")
+        try:
+            zone = ZoneInfo(tzid)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"unknown TZID {tzid}")
+    else:
+        return start, 0  # Floating time: already local
+    local = start.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+    return local, (local.date() - start.date()).days
+
+
+def _event_to_record(line, event):
+    dtstart = event.get("DTSTART", "")
+    if not re.match(r"^\d{8}T\d{6}Z?$", dtstart):
+        return RowError(line, "VEVENT has no DTSTART time")
+    try:
+        start, shift = _local_start(dtstart, event.get("DTSTART_PARAMS", {}))
+    except ValueError as e:
+        return RowError(line, f"invalid DTSTART {dtstart}: {e}")
+
+    repeat_days = ["Once"]
+    rrule = dict(part.split("=", 1) for part in event.get("RRULE", "").split(";") if "=" in part)
+    freq = rrule.get("FREQ", "").upper()
+    if freq == "DAILY":
+        repeat_days = list(DAY_NAMES)
+    elif freq == "WEEKLY":
+        byday = [d[-2:].upper() for d in rrule.get("BYDAY", "").split(",") if d]
+        if byday:
+            # BYDAY is in DTSTART's zone; move it with the conversion to local time
+            repeat_days = [DAY_NAMES[(ICS_DAYS.index(d) + shift) % 7] for d in byday if d in ICS_DAYS]
+        else:
+            # Weekly without BYDAY repeats on the weekday of DTSTART
+            repeat_days = [DAY_NAMES[start.weekday()]]
+    elif freq:
+        return RowError(line, f"unsupported RRULE frequency {freq}")
+
+    url = event.get("URL", "")
+    if not url:
+        found = SPOTIFY_URL_RE.search(_ics_unescape(event.get("DESCRIPTION", "")))
+        url = found.group(0) if found else ""
+    return {
+        "id": event.get("UID", ""),
+        "time_str": start.strftime("%H:%M"),
+        "url": url,
+        "repeat_days": repeat_days,
+        "label": _ics_unescape(event.get("SUMMARY", "")),
+        "enabled": event.get("STATUS", "").upper() != "CANCELLED",
+        "account": event.get("X-BEATWAKE-ACCOUNT", ""),
+        "device": _ics_unescape(event.get("X-BEATWAKE-DEVICE", "")),
+    }
+
+
+def _ics_unescape(text):
+    return text.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",") \
+        .replace("\\;", ";").replace("\\\\", "\\")
+
+
+def _ics_escape(text):
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "ics": read_ics}
+
+
+# --- validation ---
+
+def parse_days(value):
+    if isinstance(value, list):
+        parts = value
+    elif value is None or isinstance(value, str):
+        parts = re.split(r"[;,|\s]+", value or "")
+    else:
+        raise ValueError(f"days must be a list or a string, not {type(value).__name__}")
+    days = []
+    for part in parts:
+        if not isinstance(part, str):
+            raise ValueError(f"unknown day {part!r}")
+        part = part.strip()
+        if not part:
+            continue
+        if part.lower() == "once":
+            return ["Once"]
+        day = DAY_ALIASES.get(part.lower())
+        if day is None:
+            raise ValueError(f"unknown day {part!r}")
+        if day not in days:
+            days.append(day)
+    return days
+
+
+def parse_ramp(value):
+    """Check a ramp spec and fill in defaults for the keys it leaves out"""
+    if not isinstance(value, dict):
+        raise ValueError("ramp must be an object")
+    unknown = set(value) - set(DEFAULT_RAMP)
+    if unknown:
+        raise ValueError(f"unknown ramp keys {sorted(unknown)}")
+    ramp = dict(DEFAULT_RAMP, **value)
+    for key in ("start", "end", "seconds"):
+        number = ramp[key]
+        if isinstance(number, bool) or not isinstance(number, (int, float)):
+            raise ValueError(f"ramp {key} must be a number")
+    if not (0 <= ramp["start"] <= 100 and 0 <= ramp["end"] <= 100):
+        raise ValueError("ramp volumes must be between 0 and 100")
+    if ramp["seconds"] <= 0:
+        raise ValueError("ramp seconds must be positive")
+    if ramp["curve"] not in CURVES:
+        raise ValueError(f"unknown ramp curve {ramp['curve']!r}")
+    return ramp
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ("0", "false", "no", "off", "n")
+
+
+def _text(record, *keys):
+    for key in keys:
+        value = record.get(key)
+        if value is not None and value != "":
+            return str(value).strip()
+    return ""
+
+
+def normalize(line, record):
+    """Turn a raw record into an alarm dict, raising RowError if it's invalid"""
+    if isinstance(record, RowError):
+        raise record
+    if not isinstance(record, dict):
+        raise RowError(line, "expected an object")
+
+    time_str = _text(record, "time_str", "time")
+    match = TIME_RE.match(time_str)
+    if not match:
+        raise RowError(line, f"invalid time {time_str!r}")
+    url = _text(record, "url")
+    if resolve(url) is None:
+        raise RowError(line, f"invalid Spotify URL {url!r}")
+    try:
+        repeat_days = parse_days(record.get("repeat_days") or record.get("days"))
+    except ValueError as e:
+        raise RowError(line, str(e))
+    if not repeat_days:
+        raise RowError(line, "no repeat days")
+
+    ramp = record.get("ramp") or None
+    if isinstance(ramp, str):
+        try:
+            ramp = json.loads(ramp)
+        except json.JSONDecodeError:
+            raise RowError(line, "invalid ramp JSON")
+    if ramp is not None:
+        try:
+            ramp = parse_ramp(ramp)
+        except ValueError as e:
+            raise RowError(line, str(e))
+
+    account = _text(record, "account") or DEFAULT_ACCOUNT
+    if not is_valid_account(account):
+        raise RowError(line, f"invalid account name {account!r}")
+
+    return {
+        "id": _text(record, "id") or uuid.uuid4().hex,
+        "time_str": f"{int(match.group(1)):02d}:{match.group(2)}",
+        "url": url,
+        "repeat_days": repeat_days,
+        "enabled": parse_bool(record.get("enabled", True)),
+        "label": _text(record, "label"),
+        "account": account,
+        "device": _text(record, "device"),
+        "ramp": ramp,
+    }
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def validated_batches(records, chunk_size=CHUNK_SIZE, on_error=None):
+    """Group raw records into chunks of (line, alarm) pairs, reporting bad rows"""
+    for batch in batched(records, chunk_size):
+        alarms = []
+        for line, record in batch:
+            try:
+                alarms.append((line, normalize(line, record)))
+            except RowError as e:
+                if on_error:
+                    on_error(e)
+        yield alarms
+
+
+# --- import ---
+
+def import_alarms(path, store_path, fmt=None, chunk_size=CHUNK_SIZE, on_error=print, on_chunk=None):
+    """Stream alarms from a file into the alarms.json store.
+
+    Valid alarms are validated chunk by chunk and streamed to a staging
+    file next to the store, which replaces the store once the input is
+    exhausted; memory use depends on chunk_size, not on the size of the
+    input. The store lock is held throughout, so daemons and the GUI
+    can't change the store underneath the import, and a failed import
+    leaves the store untouched. The trade-off is that their writes wait
+    for the whole import: daemons and the GUI remove fired one-time
+    alarms off their scheduler loops so alarms keep firing, while edits
+    made in the GUI stall until the import finishes. Alarms whose id
+    is already in the store are skipped. Returns (imported, failed).
+    """
+    fmt = detect_format(path, fmt)
+    with store_lock(store_path):
+        return _import_locked(path, store_path, fmt, chunk_size, on_error, on_chunk)
+
+
+def _import_locked(path, store_path, fmt, chunk_size, on_error, on_chunk):
+    existing = read_alarms(store_path)
+    assign_ids(existing)
+    seen = {a["id"] for a in existing}
+
+    imported = 0
+    failed = 0
+
+    def report(error):
+        nonlocal failed
+        failed += 1
+        if on_error:
+            on_error(error)
+
+    tmp_path = f"{store_path}.{os.getpid()}.import"
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as src, \
+                open(tmp_path, "w", encoding="utf-8") as out:
+            first = True
+            out.write("[")
+            for alarm in existing:
+                out.write("\n  " if first else ",\n  ")
+                json.dump(alarm, out)
+                first = False
+            del existing
+
+            for chunk in validated_batches(READERS[fmt](src), chunk_size, report):
+                for line, alarm in chunk:
+                    if alarm["id"] in seen:
+                        report(RowError(line, f"duplicate alarm id {alarm['id']}"))
+                        continue
+                    seen.add(alarm["id"])
+                    out.write("\n  " if first else ",\n  ")
+                    json.dump(alarm, out)
+                    first = False
+                    imported += 1
+                if on_chunk:
+                    on_chunk(imported, failed)
+            out.write("\n]\n")
+        os.replace(tmp_path, store_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return imported, failed
+
+
+# --- export ---
+
+def write_csv(alarms, out):
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for alarm in alarms:
+        row = dict(alarm, repeat_days=";".join(alarm["repeat_days"]))
+        row["ramp"] = json.dumps(alarm["ramp"]) if alarm.get("ramp") else ""
+        writer.writerow(row)
+
+
+def write_jsonl(alarms, out):
+    for alarm in alarms:
+        out.write(json.dumps(alarm) + "\n")
+
+
+def write_ics(alarms, out, now=None):
+    now = now or datetime.now()
+    stamp = now.strftime("%Y%m%dT%H%M%S")
+    out.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//BeatWake//Alarms//EN\r\n")
+    for alarm in alarms:
+        hour, minute = map(int, alarm["time_str"].split(":"))
+        start = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if "Once" in alarm["repeat_days"] and start <= now:
+            start += timedelta(days=1)
+        out.write("BEGIN:VEVENT\r\n")
+        out.write(f"UID:{alarm.get('id') or uuid.uuid4().hex}\r\n")
+        out.write(f"DTSTAMP:{stamp}\r\n")
+        out.write(f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}\r\n")
+        if "Once" not in alarm["repeat_days"]:
+            byday = ",".join(ICS_DAYS[DAY_NAMES.index(d)] for d in alarm["repeat_days"])
+            out.write(f"RRULE:FREQ=WEEKLY;BYDAY={byday}\r\n")
+        out.write(f"SUMMARY:{_ics_escape(alarm.get('label') or 'BeatWake alarm')}\r\n")
+        out.write(f"URL:{alarm['url']}\r\n")
+        if alarm.get("account") and alarm["account"] != DEFAULT_ACCOUNT:
+            out.write(f"X-BEATWAKE-ACCOUNT:{alarm['account']}\r\n")
+        if alarm.get("device"):
+            out.write(f"X-BEATWAKE-DEVICE:{_ics_escape(alarm['device'])}\r\n")
+        if not alarm.get("enabled", True):
+            out.write("STATUS:CANCELLED\r\n")
+        out.write("END:VEVENT\r\n")
+    out.write("END:VCALENDAR\r\n")
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "ics": write_ics}
+
+
+def export_alarms(alarms, out, fmt):
+    """Write alarms (any iterable of alarm dicts) to an open text file"""
+    WRITERS[fmt](alarms, out)
@@ -0,0 +1,96 @@
+"""BeatWake alarm store - locked access to the shared alarms.json"""
+
+import json
+import os
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_SUFFIX = ".lock"
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Hold an exclusive lock on lock_path, shared by every process and thread"""
+    with open(lock_path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def store_lock(path):
+    """Lock the store at path.
+
+    Every change to alarms.json (CLI, GUI, daemons, imports) re-reads the
+    store and writes it back under this lock (see update_alarms), so
+    concurrent edits can't undo each other.
+    """
+    return file_lock(path + LOCK_SUFFIX)
+
+
+def read_alarms(path):
+    """Read alarms.json as-is; callers that modify it must hold store_lock"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_alarms(path, alarms):
+    """Atomically replace alarms.json; the caller holds store_lock"""
+    # Write then rename so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(alarms, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def assign_ids(alarms):
+    """Give id-less (legacy) alarms a random id; returns True if any changed"""
+    changed = False
+    for alarm in alarms:
+        if not alarm.get("id"):
+            alarm["id"] = uuid.uuid4().hex
+            changed = True
+    return changed
+
+
+def load_alarms(path):
+    """Read the store, persisting ids for legacy alarms that have none.
+
+    Ids are written back under the lock, so every node reading the store
+    afterwards agrees on them, even for otherwise identical alarms.
+    """
+    alarms = read_alarms(path)
+    if not any(not a.get("id") for a in alarms):
+        return alarms
+    with store_lock(path):
+        alarms = read_alarms(path)
+        if assign_ids(alarms):
+            write_alarms(path, alarms)
+    return alarms
+
+
+def update_alarms(path, change):
+    """Apply change(alarms) -> alarms to the store as one locked read-modify-write"""
+    with store_lock(path):
+        alarms = read_alarms(path)
+        assign_ids(alarms)
+        alarms = change(alarms)
+        write_alarms(path, alarms)
+    return alarms
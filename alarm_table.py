@@ -0,0 +1,411 @@
+"""BeatWake alarm table - columnar alarm storage with a binary snapshot format"""
+
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime
+
+from alarm_store import load_alarms
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+DAY_BITS = {name: 1 << i for i, name in enumerate(DAY_NAMES)}
+ONCE_BIT = 0x80
+
+NEVER = -1
+MINUTES_PER_DAY = 24 * 60
+
+SNAPSHOT_MAGIC = b"BWAT"
+SNAPSHOT_VERSION = 5
+SECTION_ALIGN = 8
+DEFAULT_ACCOUNT = "default"
+
+# (attribute, array typecode) of every numeric column, in snapshot order
+COLUMNS = [
+    ("minutes", "h"),
+    ("days", "B"),
+    ("enabled", "B"),
+    ("url_idx", "I"),
+    ("label_idx", "I"),
+    ("account_idx", "I"),
+    ("id_idx", "I"),
+    ("device_idx", "I"),
+    ("ramp_idx", "I"),
+]
+# (pool attribute, index column, alarm dict key, default value)
+POOLS = [
+    ("urls", "url_idx", "url", None),
+    ("labels", "label_idx", "label", ""),
+    ("accounts", "account_idx", "account", DEFAULT_ACCOUNT),
+    ("ids", "id_idx", "id", None),
+    ("devices", "device_idx", "device", ""),
+    ("ramps", "ramp_idx", "ramp", ""),  # volume ramp spec as canonical JSON
+]
+# magic, version, reserved, row count, size of every pool, then the byte
+# offset of every column followed by the (ends, blob) sections of every pool
+HEADER = struct.Struct(f"<4sHHI{len(POOLS)}I{len(COLUMNS) + 2 * len(POOLS)}Q")
+
+
+def encode_days(repeat_days):
+    """Pack a repeat_days list into a weekday bitmask"""
+    mask = 0
+    for day in repeat_days:
+        if day == "Once":
+            mask |= ONCE_BIT
+        else:
+            mask |= DAY_BITS.get(day, 0)
+    return mask
+
+
+def decode_days(mask):
+    """Unpack a weekday bitmask into a repeat_days list"""
+    if mask & ONCE_BIT:
+        return ["Once"]
+    return [name for name in DAY_NAMES if mask & DAY_BITS[name]]
+
+
+def is_valid_account(account):
+    """True if an account name can name its credentials file safely"""
+    return bool(account) and "/" not in account and "\\" not in account \
+        and os.sep not in account and not account.startswith(".")
+
+
+def alarm_id(alarm):
+    """Return an alarm's id, deriving one from its content if unset.
+
+    Alarms loaded from the store always carry a persisted id (see
+    alarm_store.load_alarms); derived ids only cover in-memory dicts, and
+    from_dicts disambiguates identical ones by occurrence.
+    """
+    if alarm.get("id"):
+        return alarm["id"]
+    key = "|".join([
+        alarm["time_str"], alarm["url"], ",".join(alarm["repeat_days"]),
+        alarm.get("label", ""), alarm.get("account") or DEFAULT_ACCOUNT,
+    ])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_minute(time_str):
+    """Convert "HH:MM" into minute-of-day"""
+    hour, minute = map(int, str(time_str).split(":"))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid alarm time: {time_str}")
+    return hour * 60 + minute
+
+
+def format_minute(minute):
+    """Convert minute-of-day back into "HH:MM" """
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class StringPool:
+    """Interned strings addressed by index"""
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self.index = {}
+        for s in strings:
+            self.intern(s)
+
+    def intern(self, s):
+        idx = self.index.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings.append(s)
+            self.index[s] = idx
+        return idx
+
+    def __getitem__(self, idx):
+        return self.strings[idx]
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __iter__(self):
+        return iter(self.strings)
+
+
+class MappedStringPool:
+    """Read-only string pool decoded lazily from a snapshot buffer"""
+
+    def __init__(self, ends, blob):
+        self.ends = ends
+        self.blob = blob
+
+    def __getitem__(self, idx):
+        start = self.ends[idx - 1] if idx else 0
+        return bytes(self.blob[start:self.ends[idx]]).decode("utf-8")
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def _to_le_bytes(column):
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column.tobytes()
+
+
+def _day_offset_table(weekday):
+    """Days until next fire for every (mask, later_today) pair, seen from weekday"""
+    table = array.array("b", [NEVER]) * 512
+    for mask in range(256):
+        for later_today in (0, 1):
+            if mask & ONCE_BIT:
+                offset = 0 if later_today else 1
+            else:
+                offset = NEVER
+                for days_ahead in range(8):
+                    if days_ahead == 0 and not later_today:
+                        continue
+                    if mask & (1 << ((weekday + days_ahead) % 7)):
+                        offset = days_ahead
+                        break
+            table[(mask << 1) | later_today] = offset
+    return table
+
+
+class AlarmTable:
+    """Array-backed alarm table.
+
+    Each alarm is one row across parallel columns: minute-of-day (int16),
+    weekday mask (uint8, bit 7 = Once), enabled flag (uint8) and indexes
+    into interned URL, label, account, id, preferred-device and
+    volume-ramp pools.
+    """
+
+    def __init__(self):
+        for name, typecode in COLUMNS:
+            setattr(self, name, array.array(typecode))
+        for pool, _, _, _ in POOLS:
+            setattr(self, pool, StringPool())
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.minutes)
+
+    # --- building and conversion ---
+
+    @classmethod
+    def from_dicts(cls, alarms, on_error=print):
+        """Build a table, skipping (and reporting) alarms that can't be scheduled"""
+        table = cls()
+        seen = {}
+        for alarm in alarms:
+            try:
+                if not alarm.get("id"):
+                    # Identical id-less alarms must not share a derived id
+                    derived = alarm_id(alarm)
+                    count = seen[derived] = seen.get(derived, 0) + 1
+                    alarm = dict(alarm, id=derived if count == 1 else f"{derived}-{count}")
+                table.append(alarm)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                if on_error:
+                    name = alarm.get("id") or alarm.get("label") if isinstance(alarm, dict) else alarm
+                    on_error(f"Skipping invalid alarm {name!r}: {e}")
+        return table
+
+    def append(self, alarm):
+        """Add an alarm dict as a new row and return its index.
+
+        Raises ValueError, KeyError or TypeError for a malformed alarm,
+        before any column is touched.
+        """
+        minute = parse_minute(alarm["time_str"])
+        days = encode_days(alarm["repeat_days"])
+        ramp = alarm.get("ramp")
+        alarm = dict(alarm, id=alarm_id(alarm),
+                     ramp=json.dumps(ramp, sort_keys=True) if ramp else "")
+        values = []
+        for pool, column, key, default in POOLS:
+            value = alarm[key] if default is None else (alarm.get(key) or default)
+            if not isinstance(value, str):
+                raise TypeError(f"{key} must be a string, not {type(value).__name__}")
+            values.append(value)
+
+        self._materialize()
+        for (pool, column, _, _), value in zip(POOLS, values):
+            getattr(self, column).append(getattr(self, pool).intern(value))
+        self.minutes.append(minute)
+        self.days.append(days)
+        self.enabled.append(1 if alarm.get("enabled", True) else 0)
+        return len(self) - 1
+
+    def row(self, row):
+        """Return a row as an alarm dict"""
+        alarm = {
+            "time_str": format_minute(self.minutes[row]),
+            "repeat_days": decode_days(self.days[row]),
+            "enabled": bool(self.enabled[row]),
+        }
+        for pool, column, key, _ in POOLS:
+            alarm[key] = getattr(self, pool)[getattr(self, column)[row]]
+        alarm["ramp"] = json.loads(alarm["ramp"]) if alarm["ramp"] else None
+        return alarm
+
+    def account(self, row):
+        return self.accounts[self.account_idx[row]]
+
+    def alarm_id(self, row):
+        return self.ids[self.id_idx[row]]
+
+    def to_dicts(self):
+        return [self.row(i) for i in range(len(self))]
+
+    # --- JSON interchange ---
+
+    @classmethod
+    def load_json(cls, path):
+        return cls.from_dicts(load_alarms(path))
+
+    # --- scheduling ---
+
+    def due_now(self, now=None):
+        """Return the rows that should fire during the current minute"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        day_bit = (1 << now.weekday()) | ONCE_BIT
+        minutes, days, enabled = self.minutes, self.days, self.enabled
+        return [
+            i for i in range(len(minutes))
+            if minutes[i] == minute and enabled[i] and days[i] & day_bit
+        ]
+
+    def next_fire(self, now=None):
+        """Return minutes until the next fire of every row (NEVER if it won't fire)"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        offsets = _day_offset_table(now.weekday())
+        result = array.array("i", [NEVER]) * len(self)
+        minutes, days, enabled = self.minutes, self.days, self.enabled
+        for i in range(len(minutes)):
+            if not enabled[i]:
+                continue
+            later_today = 1 if minutes[i] > minute else 0
+            days_ahead = offsets[(days[i] << 1) | later_today]
+            if days_ahead != NEVER:
+                result[i] = days_ahead * MINUTES_PER_DAY + minutes[i] - minute
+        return result
+
+    # --- binary snapshot ---
+
+    def save_snapshot(self, path):
+        """Write the table as a versioned binary snapshot"""
+        payloads = []
+        for name, typecode in COLUMNS:
+            payloads.append(_to_le_bytes(array.array(typecode, getattr(self, name))))
+        for pool, _, _, _ in POOLS:
+            ends = array.array("I")
+            blob = bytearray()
+            for s in getattr(self, pool):
+                blob += s.encode("utf-8")
+                ends.append(len(blob))
+            payloads.append(_to_le_bytes(ends))
+            payloads.append(bytes(blob))
+
+        offsets = []
+        body = bytearray()
+        position = HEADER.size
+        for payload in payloads:
+            pad = -position % SECTION_ALIGN
+            body += b"\0" * pad
+            position += pad
+            offsets.append(position)
+            body += payload
+            position += len(payload)
+
+        pool_sizes = [len(getattr(self, pool)) for pool, _, _, _ in POOLS]
+        header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(self),
+                             *pool_sizes, *offsets)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_snapshot(cls, path, use_mmap=True):
+        """Load a binary snapshot, memory-mapping it when possible"""
+        with open(path, "rb") as f:
+            if use_mmap and sys.byteorder == "little":
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = f.read()
+
+        view = memoryview(buf)
+        if len(view) < HEADER.size or bytes(view[:4]) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a BeatWake snapshot")
+        magic, version, _, count, *rest = HEADER.unpack_from(view, 0)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        pool_sizes, offsets = rest[:len(POOLS)], rest[len(POOLS):]
+
+        def column(typecode, offset, length):
+            size = array.array(typecode).itemsize * length
+            data = view[offset:offset + size]
+            if isinstance(buf, mmap.mmap):
+                return data.cast(typecode)
+            col = array.array(typecode, bytes(data))
+            if sys.byteorder != "little":
+                col.byteswap()
+            return col
+
+        table = cls()
+        for i, (name, typecode) in enumerate(COLUMNS):
+            setattr(table, name, column(typecode, offsets[i], count))
+        for i, (pool, _, _, _) in enumerate(POOLS):
+            ends_offset, blob_offset = offsets[len(COLUMNS) + 2 * i:len(COLUMNS) + 2 * i + 2]
+            ends = column("I", ends_offset, pool_sizes[i])
+            blob_size = ends[-1] if pool_sizes[i] else 0
+            setattr(table, pool, MappedStringPool(ends, view[blob_offset:blob_offset + blob_size]))
+
+        if isinstance(buf, mmap.mmap):
+            table._mmap = buf
+        else:
+            table._materialize()
+        return table
+
+    def _materialize(self):
+        """Copy mapped columns into owned arrays so the table can be modified"""
+        if isinstance(self.minutes, array.array) and isinstance(self.urls, StringPool):
+            return
+        for name, typecode in COLUMNS:
+            setattr(self, name, array.array(typecode, getattr(self, name)))
+        for pool, _, _, _ in POOLS:
+            setattr(self, pool, StringPool(list(getattr(self, pool))))
+        self.close()
+
+    def close(self):
+        """Release the snapshot mapping, if any"""
+        if self._mmap is not None:
+            mm, self._mmap = self._mmap, None
+            try:
+                mm.close()
+            except BufferError:
+                pass  # Views still exported; the mapping closes when they're collected
+
+
+def load_table(json_path, snapshot_path):
+    """Load alarms from the snapshot, rebuilding it when alarms.json is newer"""
+    if not os.path.exists(json_path):
+        return AlarmTable()
+    try:
+        if os.path.exists(snapshot_path) and \
+                os.path.getmtime(snapshot_path) >= os.path.getmtime(json_path):
+            return AlarmTable.load_snapshot(snapshot_path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Ignoring alarm snapshot: {e}")
+    table = AlarmTable.load_json(json_path)
+    try:
+        table.save_snapshot(snapshot_path)
+    except OSError as e:
+        print(f"Error saving alarm snapshot: {e}")
+    return table
@@ -0,0 +1,302 @@
+"""BeatWake audio - plays pre-decoded alarm sounds through one long-lived player"""
+
+import hashlib
+import json
+import math
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import wave
+from array import array
+
+SYSTEM_ALARM_SOUND = "/usr/share/sounds/freedesktop/stereo/alarm-clock-elapsed.oga"
+DEFAULT_CONFIG = {
+    "alarm": SYSTEM_ALARM_SOUND,  # short beep played with every alarm
+    "fallback": SYSTEM_ALARM_SOUND,  # played when Spotify and the browser both fail
+    "fallback_repeat": 5,
+}
+DECODE_RATE = 44100
+DECODE_CHANNELS = 2
+CHUNK_SIZE = 16 * 1024
+CACHE_DIR_NAME = "sound_cache"
+BEEP_HZ = 880
+BEEP_PATTERN = (0.15, 0.1, 0.15, 0.4)  # seconds on, off, on, off
+
+# sample width in bytes -> (pacat format, aplay format)
+SAMPLE_FORMATS = {
+    1: ("u8", "U8"),
+    2: ("s16le", "S16_LE"),
+    3: ("s24le", "S24_3LE"),
+    4: ("s32le", "S32_LE"),
+}
+
+
+class Sound:
+    """Raw PCM audio held in memory"""
+
+    def __init__(self, pcm, rate, channels, sample_width):
+        self.pcm = pcm
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+
+    @property
+    def format(self):
+        return (self.rate, self.channels, self.sample_width)
+
+
+def read_wav(path):
+    try:
+        with wave.open(path, "rb") as w:
+            return Sound(w.readframes(w.getnframes()), w.getframerate(),
+                         w.getnchannels(), w.getsampwidth())
+    except (OSError, wave.Error, EOFError) as e:
+        print(f"Error decoding {path}: {e}")
+        return None
+
+
+def write_wav(path, sound):
+    tmp = f"{path}.tmp"
+    try:
+        with wave.open(tmp, "wb") as w:
+            w.setnchannels(sound.channels)
+            w.setsampwidth(sound.sample_width)
+            w.setframerate(sound.rate)
+            w.writeframes(sound.pcm)
+        os.replace(tmp, path)
+    except (OSError, wave.Error) as e:
+        print(f"Error caching {path}: {e}")
+
+
+def cached_wav_path(path, cache_dir):
+    """Where the decoded copy of a sound file is kept; changes with the file"""
+    st = os.stat(path)
+    key = hashlib.sha1(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}-{key}.wav")
+
+
+def run_decoder(path):
+    """Decode Ogg, MP3 and friends with whichever external decoder is installed"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        command = [ffmpeg, "-v", "quiet", "-i", path, "-f", "s16le",
+                   "-ac", str(DECODE_CHANNELS), "-ar", str(DECODE_RATE), "-"]
+    elif shutil.which("gst-launch-1.0"):
+        command = ["gst-launch-1.0", "-q", "filesrc", f"location={path}", "!", "decodebin",
+                   "!", "audioconvert", "!", "audioresample", "!",
+                   f"audio/x-raw,format=S16LE,rate={DECODE_RATE},channels={DECODE_CHANNELS}",
+                   "!", "fdsink", "fd=1"]
+    else:
+        return None
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Error decoding {path}: {e}")
+        return None
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return Sound(result.stdout, DECODE_RATE, DECODE_CHANNELS, 2)
+
+
+def decode_sound(path, cache_dir=None):
+    """Decode a sound file to PCM; returns None if it can't be decoded.
+
+    Files other than WAV are decoded by an external tool, and the result
+    is cached as a WAV in cache_dir, so the decoder runs once per file
+    rather than once per process.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    if path.lower().endswith(".wav"):
+        return read_wav(path)
+
+    cached = cached_wav_path(path, cache_dir) if cache_dir else None
+    if cached and os.path.exists(cached):
+        sound = read_wav(cached)
+        if sound is not None:
+            return sound
+    sound = run_decoder(path)
+    if sound is not None and cached:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_wav(cached, sound)
+    return sound
+
+
+def beep_sound():
+    """A built-in two-tone beep, for when no configured sound can be decoded"""
+    samples = array("h")
+    for i, seconds in enumerate(BEEP_PATTERN):
+        for n in range(int(seconds * DECODE_RATE)):
+            value = int(12000 * math.sin(2 * math.pi * BEEP_HZ * n / DECODE_RATE)) if i % 2 == 0 else 0
+            samples.extend([value] * DECODE_CHANNELS)
+    if sys.byteorder == "big":
+        samples.byteswap()  # PCM is little-endian
+    return Sound(samples.tobytes(), DECODE_RATE, DECODE_CHANNELS, 2)
+
+
+def sink_command(sound_format):
+    """Command for a raw PCM player reading stdin, or None if none is installed"""
+    rate, channels, sample_width = sound_format
+    pacat_format, aplay_format = SAMPLE_FORMATS[sample_width]
+    if shutil.which("pacat"):
+        return ["pacat", "--raw", f"--format={pacat_format}",
+                f"--rate={rate}", f"--channels={channels}"]
+    if shutil.which("aplay"):
+        return ["aplay", "-q", "-t", "raw", "-f", aplay_format,
+                "-r", str(rate), "-c", str(channels)]
+    return None
+
+
+def play_file(path, repeat=1):
+    """Play a sound file with a one-shot paplay, which decodes Ogg itself"""
+    paplay = shutil.which("paplay")
+    if not paplay or not path or not os.path.exists(path):
+        return False
+    for _ in range(repeat):
+        try:
+            result = subprocess.run([paplay, path], stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL, timeout=60)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"Error playing {path}: {e}")
+            return False
+        if result.returncode != 0:
+            return False
+    return True
+
+
+def load_audio_config(path):
+    config = dict(DEFAULT_CONFIG)
+    try:
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                config.update(json.load(f))
+    except Exception as e:
+        print(f"Error loading audio config: {e}")
+    return config
+
+
+class AudioPlayer:
+    """Plays named sounds without spawning a process per alarm.
+
+    Sounds are decoded on first use, through a WAV cache next to the
+    config, and kept in memory; one that can't be decoded is replaced by
+    a built-in beep. A single player process (pacat or aplay) stays open
+    and is fed PCM through its stdin by a background thread, so play()
+    never blocks the caller. A sound
+    requested while the same sound is still queued is dropped, so a burst
+    of alarms rings once instead of queueing up.
+    """
+
+    def __init__(self, config_path=None):
+        self.config = load_audio_config(config_path)
+        self.cache_dir = os.path.join(os.path.dirname(config_path), CACHE_DIR_NAME) if config_path else None
+        self.sounds = {}  # name -> Sound
+        self.requests = queue.Queue()
+        self.pending = set()
+        self._lock = threading.Lock()
+        self.sink = None
+        self.sink_format = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def play(self, name="alarm", repeat=1):
+        """Queue a sound; returns False if the same sound was already pending"""
+        with self._lock:
+            if name in self.pending:
+                return False
+            self.pending.add(name)
+        self.requests.put((name, repeat))
+        return True
+
+    def play_fallback(self):
+        """Play the offline fallback sound when nothing else can wake the user"""
+        return self.play("fallback", self.config.get("fallback_repeat", 1))
+
+    def preload(self):
+        """Decode every configured sound ahead of the first alarm"""
+        for name in ("alarm", "fallback"):
+            self._sound(name)
+
+    def close(self):
+        self.requests.put(None)
+        self._thread.join(timeout=1)
+        self._close_sink()
+
+    def _sound(self, name):
+        with self._lock:
+            if name in self.sounds:
+                return self.sounds[name]
+        path = self.config.get(name)
+        sound = decode_sound(path, self.cache_dir)
+        if sound is None:
+            print(f"Can't decode {name} sound {path!r}; using the built-in beep")
+            sound = beep_sound()
+        with self._lock:
+            return self.sounds.setdefault(name, sound)
+
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            name, repeat = request
+            with self._lock:
+                self.pending.discard(name)
+            if self._write(self._sound(name), repeat):
+                continue
+            # No pacat or aplay to keep open: let a one-shot paplay play the file
+            if not play_file(self.config.get(name), repeat):
+                print('\a')  # Terminal beep as last resort
+
+    def _write(self, sound, repeat):
+        for _ in range(2):
+            sink = self._open_sink(sound.format)
+            if sink is None:
+                return False
+            try:
+                pcm = memoryview(sound.pcm)
+                for _ in range(repeat):
+                    for start in range(0, len(pcm), CHUNK_SIZE):
+                        sink.stdin.write(pcm[start:start + CHUNK_SIZE])
+                sink.stdin.flush()
+                return True
+            except (BrokenPipeError, OSError):
+                # Player died (e.g. audio server restarted); start a new one
+                self._close_sink()
+        return False
+
+    def _open_sink(self, sound_format):
+        if self.sink is not None and (self.sink.poll() is not None or self.sink_format != sound_format):
+            self._close_sink()
+        if self.sink is None:
+            command = sink_command(sound_format)
+            if command is None:
+                return None
+            try:
+                self.sink = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                self.sink_format = sound_format
+            except OSError as e:
+                print(f"Error starting audio player: {e}")
+                return None
+        return self.sink
+
+    def _close_sink(self):
+        if self.sink is not None:
+            try:
+                self.sink.stdin.close()
+            except OSError:
+                pass
+            self.sink.terminate()
+            try:
+                self.sink.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self.sink.kill()
+                self.sink.wait()
+            self.sink = None
+            self.sink_format = None
@@ -0,0 +1,170 @@
+"""BeatWake coordination - shard leases and exactly-once fire claims across nodes"""
+
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+NUM_SHARDS = 64
+LEASE_TTL = 10.0  # seconds a node keeps its shards without a heartbeat
+FIRE_RETENTION = 7 * 24 * 3600  # seconds fire claims are kept
+PRUNE_INTERVAL = 3600  # seconds between deletions of expired fire claims
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    shard INTEGER PRIMARY KEY,
+    node_id TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fires (
+    alarm_id TEXT NOT NULL,
+    scheduled TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    fired_at REAL NOT NULL,
+    PRIMARY KEY (alarm_id, scheduled)
+);
+"""
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def shard_for(alarm_id, num_shards=NUM_SHARDS):
+    """Map an alarm id onto a shard, identically on every node"""
+    return zlib.crc32(alarm_id.encode("utf-8")) % num_shards
+
+
+class Coordinator:
+    """Splits alarms between daemon nodes sharing one SQLite database.
+
+    Every node heartbeats and holds time-limited leases on a fair share of
+    the shards; leases of a node that stops heartbeating expire after
+    lease_ttl seconds and are picked up by the survivors. Leases only
+    spread the load: the guarantee against double fires is the fires
+    table, where a (alarm, scheduled instant) row can be inserted once.
+    """
+
+    def __init__(self, db_path, node_id=None, num_shards=NUM_SHARDS, lease_ttl=LEASE_TTL):
+        self.db_path = db_path
+        self.node_id = node_id or default_node_id()
+        self.num_shards = num_shards
+        self.lease_ttl = lease_ttl
+        self.owned = {}  # shard -> lease expiry
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.conn = sqlite3.connect(db_path, timeout=lease_ttl, isolation_level=None,
+                                    check_same_thread=False)
+        with self._lock:
+            self.conn.executescript(SCHEMA)
+
+    # --- leases ---
+
+    def heartbeat(self):
+        """Renew this node's leases and rebalance shards; return the owned set"""
+        now = time.time()
+        expires = now + self.lease_ttl
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute("INSERT OR REPLACE INTO nodes (node_id, heartbeat) VALUES (?, ?)",
+                            (self.node_id, now))
+                cur.execute("DELETE FROM nodes WHERE heartbeat < ?", (now - self.lease_ttl,))
+                live = cur.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+                target = math.ceil(self.num_shards / max(live, 1))
+
+                cur.execute("UPDATE leases SET expires = ? WHERE node_id = ? AND expires >= ?",
+                            (expires, self.node_id, now))
+                mine = [row[0] for row in cur.execute(
+                    "SELECT shard FROM leases WHERE node_id = ? AND expires >= ? ORDER BY shard",
+                    (self.node_id, now))]
+
+                # Hand back shards above our fair share so new nodes can take them
+                for shard in mine[target:]:
+                    cur.execute("DELETE FROM leases WHERE shard = ? AND node_id = ?",
+                                (shard, self.node_id))
+                mine = mine[:target]
+
+                if len(mine) < target:
+                    taken = {row[0] for row in cur.execute(
+                        "SELECT shard FROM leases WHERE expires >= ?", (now,))}
+                    for shard in range(self.num_shards):
+                        if len(mine) >= target:
+                            break
+                        if shard in taken:
+                            continue
+                        cur.execute("INSERT OR REPLACE INTO leases (shard, node_id, expires) "
+                                    "VALUES (?, ?, ?)", (shard, self.node_id, expires))
+                        mine.append(shard)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            self.owned = {shard: expires for shard in mine}
+        return set(mine)
+
+    def owns(self, alarm_id):
+        """True if this node currently holds the lease for the alarm's shard"""
+        expires = self.owned.get(shard_for(alarm_id, self.num_shards))
+        return expires is not None and expires > time.time()
+
+    def release(self):
+        """Give up every lease, e.g. on clean shutdown"""
+        with self._lock:
+            self.conn.execute("DELETE FROM leases WHERE node_id = ?", (self.node_id,))
+            self.conn.execute("DELETE FROM nodes WHERE node_id = ?", (self.node_id,))
+            self.owned = {}
+
+    # --- fire claims ---
+
+    def claim_fire(self, alarm_id, scheduled):
+        """Record that this node fires alarm_id for the scheduled instant.
+
+        Returns False if any node already claimed it.
+        """
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO fires (alarm_id, scheduled, node_id, fired_at) "
+                "VALUES (?, ?, ?, ?)", (alarm_id, scheduled, self.node_id, time.time()))
+            return cur.rowcount == 1
+
+    def prune_fires(self, retention=FIRE_RETENTION):
+        """Forget fire claims older than retention seconds"""
+        with self._lock:
+            self.conn.execute("DELETE FROM fires WHERE fired_at < ?", (time.time() - retention,))
+
+    # --- background heartbeat ---
+
+    def start(self):
+        """Heartbeat in the background every third of the lease TTL"""
+        self.heartbeat()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        last_prune = None
+        while not self._stop.wait(self.lease_ttl / 3):
+            try:
+                self.heartbeat()
+                if last_prune is None or time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                    self.prune_fires()
+                    last_prune = time.monotonic()
+            except sqlite3.Error as e:
+                print(f"Coordinator heartbeat failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.release()
+        self.conn.close()
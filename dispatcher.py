@@ -0,0 +1,41 @@
+"""BeatWake dispatcher - shared worker pool for non-blocking alarm actions"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 8
+
+
+class Dispatcher:
+    """Runs playback and other network calls off the scheduler thread"""
+
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="beatwake")
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return its future"""
+        future = self.executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(_report_error)
+        return future
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+def _report_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Dispatcher task failed: {future.exception()}")
+
+
+_default_dispatcher = None
+_default_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Return the process-wide dispatcher"""
+    global _default_dispatcher
+    with _default_lock:
+        if _default_dispatcher is None:
+            _default_dispatcher = Dispatcher()
+        return _default_dispatcher
@@ -0,0 +1,259 @@
+"""BeatWake fire journal - append-only record of every alarm fire"""
+
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+
+from alarm_store import file_lock
+
+MAX_SEGMENT_BYTES = 4 * 1024 * 1024
+MAX_SEGMENTS = 16
+FLUSH_INTERVAL = 1.0  # seconds
+SEGMENT_PREFIX = "fires-"
+SEGMENT_SUFFIX = ".jsonl"
+INDEX_SUFFIX = ".idx"  # sidecar index next to each segment
+LOCK_NAME = "journal.lock"
+SCHEDULED_FORMAT = "%Y-%m-%d %H:%M"  # the minute an alarm was due, as used in fire keys
+
+# How an alarm was delivered
+PATH_SPOTIFY = "spotify"
+PATH_BROWSER = "browser"
+PATH_SOUND = "sound"
+PATH_SNOOZE = "snooze"
+
+
+class FireJournal:
+    """Size-rotated JSON Lines log of fires, with per-segment sidecar indexes.
+
+    record() only queues the entry; a background thread appends queued
+    entries in batches, so the firing path never waits on the disk. Each
+    batch also appends one line to its segment's sidecar index, giving
+    the byte range each day occupies and the alarms it mentions, so range
+    queries read only the matching slices. Sidecars only ever grow and
+    are read afresh by every query, and appends are serialized by a lock
+    file, so the GUI and daemons sharing a directory see each other's
+    fires.
+    """
+
+    def __init__(self, directory, max_bytes=MAX_SEGMENT_BYTES, max_segments=MAX_SEGMENTS,
+                 flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            for segment in self._segments():
+                self._catch_up(segment)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # --- writing ---
+
+    def record(self, alarm_id, scheduled, path, label="", account="", error=None, **extra):
+        """Queue a journal entry; never blocks"""
+        entry = {
+            "alarm_id": alarm_id,
+            "label": label,
+            "account": account,
+            "scheduled": scheduled,
+            "actual": datetime.now().isoformat(timespec="seconds"),
+            "path": path,
+        }
+        if error:
+            entry["error"] = str(error)
+        entry.update(extra)
+        self.queue.put(entry)
+
+    def flush(self):
+        """Block until every queued entry is on disk"""
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                self.queue.task_done()
+                return
+            batch = [entry]
+            # Give a burst of fires a moment to pile up, then write them together
+            stop = False
+            try:
+                while True:
+                    more = self.queue.get(timeout=self.flush_interval if len(batch) == 1 else 0)
+                    if more is None:
+                        stop = True
+                        break
+                    batch.append(more)
+            except queue.Empty:
+                pass
+            try:
+                self._append(batch)
+            except OSError as e:
+                print(f"Error writing fire journal: {e}")
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _locked(self):
+        return file_lock(os.path.join(self.directory, LOCK_NAME))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _append(self, batch):
+        with self._locked():
+            i = 0
+            while i < len(batch):
+                segment = self._current_segment()
+                summary = {"days": {}, "alarms": set()}
+                lines = []
+                with open(self._path(segment), "ab") as f:
+                    start = offset = f.tell()
+                    while i < len(batch) and offset < self.max_bytes:
+                        line = (json.dumps(batch[i], separators=(",", ":")) + "\n").encode("utf-8")
+                        _summarize(summary, batch[i], offset, offset + len(line))
+                        lines.append(line)
+                        offset += len(line)
+                        i += 1
+                    f.write(b"".join(lines))
+                self._append_index(segment, start, offset, summary)
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+    def _current_segment(self):
+        # Caller holds the lock; the directory, not memory, says which segment is current
+        segments = self._segments()
+        if segments and os.path.getsize(self._path(segments[-1])) < self.max_bytes:
+            return segments[-1]
+        number = int(segments[-1][len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1 if segments else 1
+        segment = f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+        open(self._path(segment), "ab").close()
+        for oldest in (segments + [segment])[:-self.max_segments]:
+            for name in (oldest, _index_name(oldest)):
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+        return segment
+
+    # --- index ---
+
+    def _append_index(self, segment, start, end, summary):
+        record = {"start": start, "end": end, "days": summary["days"],
+                  "alarms": sorted(summary["alarms"])}
+        with open(self._path(_index_name(segment)), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def _read_index(self, segment):
+        """Merge a segment's sidecar into (days, alarms, indexed end)"""
+        days, alarms, end = {}, set(), 0
+        try:
+            with open(self._path(_index_name(segment)), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write
+                    for day, (first, last) in record["days"].items():
+                        if day in days:
+                            days[day] = [min(days[day][0], first), max(days[day][1], last)]
+                        else:
+                            days[day] = [first, last]
+                    alarms.update(record["alarms"])
+                    end = max(end, record["end"])
+        except FileNotFoundError:
+            pass
+        return days, alarms, end
+
+    def _catch_up(self, segment):
+        """Index bytes a crashed writer appended without indexing; caller holds the lock"""
+        path = self._path(segment)
+        _, _, end = self._read_index(segment)
+        size = os.path.getsize(path)
+        if size <= end:
+            return
+        summary = {"days": {}, "alarms": set()}
+        with open(path, "rb+") as f:
+            f.seek(end)
+            offset = end
+            for line in f:
+                try:
+                    _summarize(summary, json.loads(line), offset, offset + len(line))
+                except (ValueError, KeyError):
+                    pass  # Torn write
+                offset += len(line)
+            if not line.endswith(b"\n"):
+                f.write(b"\n")  # Terminate a torn line so the next entry starts cleanly
+                offset += 1
+        self._append_index(segment, end, offset, summary)
+
+    # --- queries ---
+
+    def query(self, start_day=None, end_day=None, alarm_id=None, limit=None):
+        """Entries with start_day <= day <= end_day (YYYY-MM-DD), newest first"""
+        results = []
+        for segment in reversed(self._segments()):
+            days, alarms, indexed_end = self._read_index(segment)
+            try:
+                size = os.path.getsize(self._path(segment))
+            except FileNotFoundError:
+                continue  # Rotated away meanwhile
+            ranges = []
+            if alarm_id is None or alarm_id in alarms:
+                ranges = [r for day, r in days.items()
+                          if (start_day is None or day >= start_day) and (end_day is None or day <= end_day)]
+            if size > indexed_end:
+                ranges.append([indexed_end, size])  # Being written right now
+            if not ranges:
+                continue
+            start = min(r[0] for r in ranges)
+            end = max(r[1] for r in ranges)
+            try:
+                with open(self._path(segment), "rb") as f:
+                    f.seek(start)
+                    chunk = f.read(end - start)
+            except FileNotFoundError:
+                continue
+            entries = []
+            for line in chunk.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                day = entry["actual"][:10]
+                if start_day is not None and day < start_day:
+                    continue
+                if end_day is not None and day > end_day:
+                    continue
+                if alarm_id is not None and entry["alarm_id"] != alarm_id:
+                    continue
+                entries.append(entry)
+            results.extend(reversed(entries))
+            if limit is not None and len(results) >= limit:
+                return results[:limit]
+        return results
+
+
+def _index_name(segment):
+    return segment[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+
+def _summarize(summary, entry, start, end):
+    day = entry["actual"][:10]
+    days = summary["days"]
+    if day in days:
+        days[day][1] = end
+    else:
+        days[day] = [start, end]
+    summary["alarms"].add(entry["alarm_id"])
@@ -3,22 +3,60 @@ import os
 import webbrowser
 import base64
 import requests
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlencode, parse_qs
+from requests.adapters import HTTPAdapter
+import html
+import secrets
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlencode, urlsplit, parse_qs
 import threading
+import time
+from dispatcher import get_dispatcher
+from spotify_uri import play_payload, resolve
 
 SPOTIFY_AUTH_URL = "https://accounts.spotify.com/authorize"
 SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
-REDIRECT_URI = "http://localhost:8888/callback"
+CALLBACK_HOST = "localhost"
+CALLBACK_PORT = 8888
+CALLBACK_PATH = "/callback"
+REDIRECT_URI = f"http://{CALLBACK_HOST}:{CALLBACK_PORT}{CALLBACK_PATH}"
+LOGIN_TIMEOUT = 300  # seconds a login may wait for the browser redirect
 SCOPES = "user-modify-playback-state user-read-playback-state"
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+HTTP_POOL_SIZE = 32
+DEVICE_CACHE_TTL = 60  # seconds before the device list is refetched
+DEVICE_REFRESH_AHEAD = DEVICE_CACHE_TTL / 2  # background refetch once a list is this old
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Return the process-wide HTTP session shared by every SpotifyAuth"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            _http_session = session
+        return _http_session
+
+def extract_track_uri(url):
+    """Extract Spotify URI from URL"""
+    parsed = resolve(url)
+    return parsed.uri if parsed else None
 
 class SpotifyAuth:
-    def __init__(self, config_path):
+    def __init__(self, config_path, session=None):
         self.config_path = config_path
+        self.session = session or get_http_session()
         self.client_id = None
         self.client_secret = None
         self.access_token = None
         self.refresh_token = None
+        self.inherited_credentials = False  # client id/secret borrowed; never saved
+        self.devices = []
+        self.devices_fetched_at = None  # monotonic time; None until fetched
+        self._devices_lock = threading.Lock()
         self.load_config()
     
     def load_config(self):
@@ -43,6 +81,9 @@ class SpotifyAuth:
                 'access_token': self.access_token,
                 'refresh_token': self.refresh_token
             }
+            if self.inherited_credentials:
+                # Keep the household app's secret out of tenant files
+                data['client_id'] = data['client_secret'] = None
             with open(self.config_path, 'w') as f:
                 json.dump(data, f, indent=2)
         except Exception as e:
@@ -52,9 +93,10 @@ class SpotifyAuth:
         """Set Spotify app credentials"""
         self.client_id = client_id
         self.client_secret = client_secret
+        self.inherited_credentials = False
         self.save_config()
     
-    def get_auth_url(self):
+    def get_auth_url(self, state=None):
         """Generate Spotify authorization URL"""
         if not self.client_id:
             return None
@@ -65,22 +107,33 @@ class SpotifyAuth:
             'redirect_uri': REDIRECT_URI,
             'scope': SCOPES
         }
+        if state:
+            params['state'] = state
         return f"{SPOTIFY_AUTH_URL}?{urlencode(params)}"
     
-    def start_auth_flow(self, callback):
-        """Start OAuth flow with callback server"""
-        auth_url = self.get_auth_url()
-        if not auth_url:
-            return False
+    def start_auth_flow(self, callback, timeout=LOGIN_TIMEOUT, open_browser=True):
+        """Start OAuth flow on the shared callback server.
+
+        callback(success) runs once, when the login completes, fails or
+        times out. Returns the auth URL, or None if the flow can't start.
+        """
+        if not self.client_id:
+            return None
+        
+        server = get_callback_server()
+        try:
+            server.start()
+        except OSError as e:
+            print(f"Error starting callback server: {e}")
+            return None
         
-        # Start callback server
-        server = CallbackServer(self, callback)
-        server_thread = threading.Thread(target=server.start, daemon=True)
-        server_thread.start()
+        state = server.register(self, callback, timeout)
+        auth_url = self.get_auth_url(state)
         
         # Open browser
-        webbrowser.open(auth_url)
-        return True
+        if open_browser:
+            webbrowser.open(auth_url)
+        return auth_url
     
     def exchange_code(self, code):
         """Exchange authorization code for access token"""
@@ -102,7 +155,7 @@ class SpotifyAuth:
         }
         
         try:
-            response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+            response = self.session.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
             if response.status_code == 200:
                 tokens = response.json()
                 self.access_token = tokens.get('access_token')
@@ -133,7 +186,7 @@ class SpotifyAuth:
         }
         
         try:
-            response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+            response = self.session.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
             if response.status_code == 200:
                 tokens = response.json()
                 self.access_token = tokens.get('access_token')
@@ -149,11 +202,11 @@ class SpotifyAuth:
         return self.access_token is not None
     
     def play_track(self, track_uri, device_id=None):
-        """Play a specific track"""
+        """Play a track, episode, album, playlist, artist or show URI"""
         if not self.access_token:
             return False
         
-        url = "https://api.spotify.com/v1/me/player/play"
+        url = f"{SPOTIFY_API_URL}/me/player/play"
         if device_id:
             url += f"?device_id={device_id}"
         
@@ -162,90 +215,351 @@ class SpotifyAuth:
             'Content-Type': 'application/json'
         }
         
-        data = {
-            'uris': [track_uri]
-        }
+        data = play_payload(track_uri)
         
         try:
-            response = requests.put(url, headers=headers, json=data)
+            response = self.session.put(url, headers=headers, json=data)
             if response.status_code == 401:
                 # Token expired, try refresh
                 if self.refresh_access_token():
                     return self.play_track(track_uri, device_id)
+            if response.status_code == 404:
+                # Device gone or none active; make the next lookup refetch
+                self.devices_fetched_at = None
             return response.status_code in [200, 204]
         except Exception as e:
             print(f"Error playing track: {e}")
             return False
     
-    def set_volume(self, volume_percent):
+    def play_on_device(self, track_uri, preferred_device=None, volume=None):
+        """Play a track on the preferred device, or on whichever device can play it.
+        
+        If volume is given it is set before playback starts, so a volume
+        ramp doesn't begin at whatever the device was last left at.
+        """
+        if self._play_on(track_uri, self.pick_device(preferred_device), volume):
+            return True
+        # The cached device list may be stale; refetch once and retry
+        if not self.refresh_devices():
+            return False
+        return self._play_on(track_uri, self.pick_device(preferred_device), volume)
+    
+    def pick_device(self, preferred_device=None):
+        """Choose a playback target: the preferred device, the active one, or any"""
+        device = self.find_device(preferred_device)
+        if device is not None:
+            return device
+        devices = self.cached_devices()
+        for device in devices:
+            if device.get('is_active'):
+                return device
+        # Nothing active: Spotify answers 404 unless a device is named
+        return devices[0] if devices else None
+    
+    def _play_on(self, track_uri, device, volume=None):
+        device_id = device['id'] if device else None
+        if device is not None and not device.get('is_active'):
+            self.transfer_playback(device_id)
+        if volume is not None:
+            self.set_volume(volume, device_id)
+        return self.play_track(track_uri, device_id)
+    
+    def get_metadata(self, uri):
+        """Fetch name, duration and playability of a URI; None on failure"""
+        parsed = resolve(uri)
+        if parsed is None or not self.access_token:
+            return None
+        
+        if parsed.kind == 'show':
+            # The show object embeds a page of episodes, and shows don't go
+            # unavailable the way tracks do, so don't fetch it just for a name
+            return {'name': None, 'duration_ms': None, 'playable': True}
+        url = f"{SPOTIFY_API_URL}/{parsed.kind}s/{parsed.id}"
+        if parsed.kind in ('track', 'episode', 'album'):
+            url += "?market=from_token"
+        elif parsed.kind == 'playlist':
+            url += "?fields=name"  # Not the whole track list
+        headers = {
+            'Authorization': f'Bearer {self.access_token}'
+        }
+        
+        try:
+            response = self.session.get(url, headers=headers)
+            if response.status_code == 401:
+                if self.refresh_access_token():
+                    return self.get_metadata(uri)
+                return None
+            if response.status_code == 404:
+                return {'name': None, 'duration_ms': None, 'playable': False}
+            if response.status_code != 200:
+                return None
+            item = response.json()
+            return {
+                'name': item.get('name'),
+                'duration_ms': item.get('duration_ms'),
+                'playable': item.get('is_playable', True)
+            }
+        except Exception as e:
+            print(f"Error fetching metadata: {e}")
+            return None
+    
+    def device_age(self):
+        """Seconds since the device list was fetched, or None if it never was"""
+        if self.devices_fetched_at is None:
+            return None
+        return time.monotonic() - self.devices_fetched_at
+    
+    def get_devices(self, max_age=DEVICE_CACHE_TTL):
+        """Return available playback devices, cached for max_age seconds"""
+        age = self.device_age()
+        if age is None or age > max_age:
+            self.refresh_devices(max_age)
+        return self.devices
+    
+    def cached_devices(self):
+        """Device list for the fire path: the cache, however old, fetched only if empty.
+
+        The background refresh keeps it fresh; a failed play refetches anyway.
+        """
+        if self.devices_fetched_at is None:
+            self.refresh_devices()
+        return self.devices
+    
+    def devices_stale(self, max_age=DEVICE_REFRESH_AHEAD):
+        age = self.device_age()
+        return age is None or age > max_age
+    
+    def refresh_devices(self, max_age=None):
+        """Fetch the device list from Spotify into the cache.
+        
+        A fetch that waited for another one to finish reuses its result,
+        as does one whose list became younger than max_age meanwhile.
+        """
+        if not self.access_token:
+            return False
+        
+        requested = time.monotonic()
+        with self._devices_lock:
+            fetched_at = self.devices_fetched_at
+            if fetched_at is not None and (fetched_at >= requested or
+                                           (max_age is not None and requested - fetched_at <= max_age)):
+                return True
+            headers = {
+                'Authorization': f'Bearer {self.access_token}'
+            }
+            try:
+                response = self.session.get(f"{SPOTIFY_API_URL}/me/player/devices", headers=headers)
+                if response.status_code == 401:
+                    if not self.refresh_access_token():
+                        return False
+                    headers['Authorization'] = f'Bearer {self.access_token}'
+                    response = self.session.get(f"{SPOTIFY_API_URL}/me/player/devices", headers=headers)
+                if response.status_code != 200:
+                    return False
+                self.devices = response.json().get('devices', [])
+                self.devices_fetched_at = time.monotonic()
+                return True
+            except Exception as e:
+                print(f"Error fetching devices: {e}")
+                return False
+    
+    def find_device(self, name_or_id):
+        """Look up a cached device by id or (case-insensitive) name"""
+        if not name_or_id:
+            return None
+        wanted = name_or_id.lower()
+        for device in self.cached_devices():
+            if device.get('id') == name_or_id or (device.get('name') or '').lower() == wanted:
+                return device
+        return None
+    
+    def transfer_playback(self, device_id, play=False):
+        """Make device_id the active playback device"""
+        if not self.access_token:
+            return False
+        
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+            'Content-Type': 'application/json'
+        }
+        
+        data = {
+            'device_ids': [device_id],
+            'play': play
+        }
+        
+        try:
+            response = self.session.put(f"{SPOTIFY_API_URL}/me/player", headers=headers, json=data)
+            if response.status_code == 401:
+                if self.refresh_access_token():
+                    return self.transfer_playback(device_id, play)
+            if response.status_code in [200, 202, 204]:
+                with self._devices_lock:
+                    for device in self.devices:
+                        device['is_active'] = device.get('id') == device_id
+                return True
+            return False
+        except Exception as e:
+            print(f"Error transferring playback: {e}")
+            return False
+    
+    def set_volume(self, volume_percent, device_id=None):
         """Set playback volume (0-100)"""
         if not self.access_token:
             return False
         
-        url = f"https://api.spotify.com/v1/me/player/volume?volume_percent={volume_percent}"
+        url = f"{SPOTIFY_API_URL}/me/player/volume?volume_percent={volume_percent}"
+        if device_id:
+            url += f"&device_id={device_id}"
         
         headers = {
             'Authorization': f'Bearer {self.access_token}'
         }
         
         try:
-            response = requests.put(url, headers=headers)
+            response = self.session.put(url, headers=headers)
             if response.status_code == 401:
                 if self.refresh_access_token():
-                    return self.set_volume(volume_percent)
+                    return self.set_volume(volume_percent, device_id)
             return response.status_code in [200, 204]
         except Exception as e:
             print(f"Error setting volume: {e}")
             return False
 
-class CallbackServer:
-    def __init__(self, auth, callback):
+class PendingLogin:
+    """A login waiting for Spotify to redirect back with its state"""
+
+    def __init__(self, auth, callback, timer):
         self.auth = auth
         self.callback = callback
+        self.timer = timer
+
+
+class CallbackServer:
+    """One long-lived OAuth callback listener shared by every login.
+
+    Each login registers a random state that Spotify echoes back on the
+    redirect, so any number of logins (one per account) can be pending at
+    once. Logins not completed within timeout seconds are dropped and
+    reported as failed. Token exchange runs on the dispatcher, never on
+    the request handler thread.
+    """
+
+    def __init__(self, host=CALLBACK_HOST, port=CALLBACK_PORT, dispatcher=None):
+        self.host = host
+        self.port = port
+        self.dispatcher = dispatcher or get_dispatcher()
+        self.pending = {}  # state -> PendingLogin
         self.server = None
-    
+        self._lock = threading.Lock()
+
     def start(self):
-        """Start HTTP server for OAuth callback"""
-        handler = self.create_handler()
-        self.server = HTTPServer(('localhost', 8888), handler)
-        self.server.handle_request()  # Handle one request then stop
-    
+        """Start listening if not already; raises OSError if the port is taken"""
+        with self._lock:
+            if self.server is not None:
+                return
+            server = ThreadingHTTPServer((self.host, self.port), self.create_handler())
+            server.daemon_threads = True
+            self.server = server
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            server, self.server = self.server, None
+            pending, self.pending = self.pending, {}
+        for login in pending.values():
+            login.timer.cancel()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    def register(self, auth, callback, timeout=LOGIN_TIMEOUT):
+        """Add a pending login and return the state to send with it"""
+        state = secrets.token_urlsafe(16)
+        timer = threading.Timer(timeout, self._expire, args=(state,))
+        timer.daemon = True
+        with self._lock:
+            self.pending[state] = PendingLogin(auth, callback, timer)
+        timer.start()
+        return state
+
+    def cancel(self, state):
+        login = self._take(state)
+        if login is not None:
+            login.timer.cancel()
+
+    def _take(self, state):
+        with self._lock:
+            return self.pending.pop(state, None)
+
+    def _expire(self, state):
+        login = self._take(state)
+        if login is not None:
+            print("Spotify login timed out")
+            login.callback(False)
+
+    def _complete(self, login, code):
+        success = False
+        try:
+            success = login.auth.exchange_code(code)
+        finally:
+            login.callback(success)
+
+    def handle_callback(self, query):
+        """Route a redirect to its pending login; returns (status, message)"""
+        state = query.get('state', [None])[0]
+        login = self._take(state) if state else None
+        if login is None:
+            return 400, "This sign-in link has expired or was already used. Please try again from BeatWake."
+        login.timer.cancel()
+
+        code = query.get('code', [None])[0]
+        if not code:
+            error = query.get('error', ['no authorization code'])[0]
+            self.dispatcher.submit(login.callback, False)
+            return 400, f"Spotify did not authorize BeatWake ({error}). Please try again."
+
+        self.dispatcher.submit(self._complete, login, code)
+        return 200, "Authorization received! You can close this window and return to BeatWake."
+
     def create_handler(self):
-        """Create request handler with access to auth and callback"""
-        auth = self.auth
-        callback = self.callback
-        
+        """Create request handler with access to the pending logins"""
+        server = self
+
         class CallbackHandler(BaseHTTPRequestHandler):
             def do_GET(self):
-                query = parse_qs(self.path.split('?')[1] if '?' in self.path else '')
-                code = query.get('code', [None])[0]
-                
-                if code:
-                    success = auth.exchange_code(code)
-                    callback(success)
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    
-                    if success:
-                        html = """
-                        <html><body style="font-family: Arial; text-align: center; padding: 50px;">
-                        <h1>✅ Success!</h1>
-                        <p>You're now connected to Spotify!</p>
-                        <p>You can close this window and return to BeatWake.</p>
-                        </body></html>
-                        """
-                    else:
-                        html = """
-                        <html><body style="font-family: Arial; text-align: center; padding: 50px;">
-                        <h1>❌ Error</h1>
-                        <p>Failed to connect to Spotify. Please try again.</p>
-                        </body></html>
-                        """
-                    self.wfile.write(html.encode())
-            
+                parts = urlsplit(self.path)
+                if parts.path != CALLBACK_PATH:
+                    self.send_error(404)  # e.g. /favicon.ico
+                    return
+
+                status, message = server.handle_callback(parse_qs(parts.query))
+                title = "✅ Success!" if status == 200 else "❌ Error"
+                page = f"""
+                <html><body style="font-family: Arial; text-align: center; padding: 50px;">
+                <h1>{title}</h1>
+                <p>{html.escape(message)}</p>
+                </body></html>
+                """.encode()
+                self.send_response(status)
+                self.send_header('Content-type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
             def log_message(self, format, *args):
                 pass  # Suppress logging
-        
+
         return CallbackHandler
+
+
+_callback_server = None
+_callback_server_lock = threading.Lock()
+
+def get_callback_server():
+    """Return the process-wide OAuth callback listener"""
+    global _callback_server
+    with _callback_server_lock:
+        if _callback_server is None:
+            _callback_server = CallbackServer()
+        return _callback_server
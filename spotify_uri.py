@@ -0,0 +1,171 @@
+"""BeatWake Spotify URIs - URL resolution and a persistent metadata cache"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+# Spotify ids are 22 base62 characters
+_ID = r"([A-Za-z0-9]{22})"
+_KINDS = r"(track|album|playlist|artist|episode|show)"
+URL_RE = re.compile(
+    r"^(?:https?://)?open\.spotify\.com/"
+    r"(?:intl-[a-z]{2}(?:-[a-z]{2,4})?/)?"  # locale prefix, e.g. /intl-de/ or /intl-pt-br/
+    r"(?:embed/)?(?:user/[^/]+/)?"
+    + _KINDS + r"/" + _ID + r"(?:[/?#].*)?$",
+    re.IGNORECASE,
+)
+URI_RE = re.compile(r"^spotify:(?:user:[^:]+:)?" + _KINDS + r":" + _ID + r"$")
+
+# Kinds Spotify plays from "uris"; everything else needs "context_uri"
+PLAYABLE_ITEMS = ("track", "episode")
+
+METADATA_TTL = 7 * 24 * 3600  # seconds
+METADATA_MAX_ENTRIES = 2048
+
+
+class SpotifyURI(namedtuple("SpotifyURI", ["kind", "id"])):
+    __slots__ = ()
+
+    @property
+    def uri(self):
+        return f"spotify:{self.kind}:{self.id}"
+
+    def play_payload(self):
+        """Body for PUT /me/player/play that starts this item"""
+        if self.kind in PLAYABLE_ITEMS:
+            return {"uris": [self.uri]}
+        return {"context_uri": self.uri}
+
+    def __str__(self):
+        return self.uri
+
+
+@lru_cache(maxsize=4096)
+def resolve(url):
+    """Parse an open.spotify.com URL or spotify: URI; None if it isn't one"""
+    if not url:
+        return None
+    url = url.strip()
+    match = URL_RE.match(url) or URI_RE.match(url)
+    if not match:
+        return None
+    return SpotifyURI(match.group(1).lower(), match.group(2))
+
+
+def play_payload(uri):
+    """Play body for a URI string, falling back to "uris" for unknown input"""
+    parsed = resolve(uri)
+    return parsed.play_payload() if parsed else {"uris": [uri]}
+
+
+class MetadataCache:
+    """Bounded LRU of item metadata, persisted to a JSON file.
+
+    Entries hold name and duration_ms for each URI, so list views and
+    pre-fire checks don't go to the network. Playability depends on the
+    account's market and subscription, so it is kept per account inside
+    the entry. Anything older than ttl seconds is refetched on the next
+    lookup.
+    """
+
+    def __init__(self, path, maxsize=METADATA_MAX_ENTRIES, ttl=METADATA_TTL):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            if self.path and os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for uri, entry in sorted(data.items(), key=lambda item: item[1].get("fetched_at", 0)):
+                    self.entries[uri] = entry
+                self._trim()
+        except Exception as e:
+            print(f"Error loading metadata cache: {e}")
+
+    def save(self):
+        """Write the cache to disk if it changed"""
+        with self._lock:
+            if not self.dirty or not self.path:
+                return
+            data = dict(self.entries)
+            self.dirty = False
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving metadata cache: {e}")
+
+    def get(self, uri, allow_stale=True):
+        """Cached metadata for a URI, or None"""
+        with self._lock:
+            entry = self.entries.get(str(uri))
+            if entry is None:
+                return None
+            if not allow_stale and time.time() - entry.get("fetched_at", 0) > self.ttl:
+                return None
+            self.entries.move_to_end(str(uri))
+            return entry
+
+    def put(self, uri, fetched, account):
+        """Store a get_metadata() result fetched through account"""
+        now = time.time()
+        with self._lock:
+            old = self.entries.get(str(uri)) or {}
+            entry = {
+                # A 404 for one account has no name; keep what others saw
+                "name": fetched.get("name") or old.get("name"),
+                "duration_ms": fetched.get("duration_ms") or old.get("duration_ms"),
+                "fetched_at": now,
+                "playable": dict(self._playable(old)),
+            }
+            entry["playable"][account] = [bool(fetched.get("playable", True)), now]
+            self.entries[str(uri)] = entry
+            self.entries.move_to_end(str(uri))
+            self._trim()
+            self.dirty = True
+        return entry
+
+    def is_fresh(self, uri, account):
+        """True if the URI's metadata and the account's playability are both current"""
+        entry = self.get(uri, allow_stale=False)
+        checked = self._playable(entry).get(account) if entry else None
+        return checked is not None and time.time() - checked[1] <= self.ttl
+
+    def lookup(self, auth, uri, account):
+        """Cached metadata, fetching it through auth when missing or expired"""
+        if self.is_fresh(uri, account) or auth is None or not auth.is_authenticated():
+            return self.get(uri)
+        fetched = auth.get_metadata(uri)
+        if fetched is None:
+            return self.get(uri)
+        return self.put(uri, fetched, account)
+
+    def is_playable(self, uri, account):
+        """False only if the cache knows the item can't be played by this account"""
+        entry = self.get(uri)
+        checked = self._playable(entry).get(account) if entry else None
+        if checked is None or time.time() - checked[1] > self.ttl:
+            return True
+        return checked[0]
+
+    @staticmethod
+    def _playable(entry):
+        # account -> [playable, checked_at]; older caches stored one shared bool
+        playable = entry.get("playable")
+        return playable if isinstance(playable, dict) else {}
+
+    def _trim(self):
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
@@ -0,0 +1,122 @@
+"""BeatWake tenants - one SpotifyAuth per account, loaded on demand"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from alarm_table import DEFAULT_ACCOUNT, is_valid_account
+from spotify_auth import DEVICE_REFRESH_AHEAD, SpotifyAuth, get_http_session
+
+IDLE_TIMEOUT = 15 * 60  # seconds before an unused account is dropped
+MAX_LOADED = 256
+
+
+class SpotifyAuthPool:
+    """Lazily loaded SpotifyAuth instances keyed by account.
+
+    Each account keeps its own token state in <accounts_dir>/<account>.json.
+    All instances share one HTTP session. Accounts nobody has used for
+    idle_timeout seconds are dropped, and at most max_loaded stay in memory,
+    so idle tenants cost nothing beyond their file on disk.
+    """
+
+    def __init__(self, accounts_dir, default_config_path=None, session=None,
+                 idle_timeout=IDLE_TIMEOUT, max_loaded=MAX_LOADED):
+        self.accounts_dir = accounts_dir
+        self.default_config_path = default_config_path
+        self.session = session or get_http_session()
+        self.idle_timeout = idle_timeout
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()  # account -> (SpotifyAuth, last_used)
+        self._lock = threading.Lock()
+        self._default = None
+
+    def config_path(self, account):
+        if account == DEFAULT_ACCOUNT and self.default_config_path:
+            return self.default_config_path
+        if not is_valid_account(account):
+            raise ValueError(f"Invalid account name: {account!r}")
+        return os.path.join(self.accounts_dir, f"{account}.json")
+
+    def get(self, account=None):
+        """Return the SpotifyAuth for an account, loading it if needed"""
+        account = account or DEFAULT_ACCOUNT
+        if account == DEFAULT_ACCOUNT and self._default is not None:
+            return self._default
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._loaded.get(account)
+            if entry is not None:
+                self._loaded[account] = (entry[0], now)
+                self._loaded.move_to_end(account)
+                return entry[0]
+
+        # Read the credentials file outside the lock
+        auth = SpotifyAuth(self.config_path(account), session=self.session)
+        if account != DEFAULT_ACCOUNT and not auth.client_id:
+            # Tenants normally share the household app's client credentials
+            default = self.get(DEFAULT_ACCOUNT)
+            auth.client_id = default.client_id
+            auth.client_secret = default.client_secret
+            auth.inherited_credentials = True
+
+        if account == DEFAULT_ACCOUNT:
+            # The default account is pinned and never evicted
+            with self._lock:
+                if self._default is None:
+                    self._default = auth
+                return self._default
+
+        with self._lock:
+            entry = self._loaded.get(account)
+            if entry is not None:
+                return entry[0]
+            self._loaded[account] = (auth, now)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return auth
+
+    def evict_idle(self):
+        """Drop accounts unused for longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            # Entries are kept in least-recently-used order
+            while self._loaded:
+                account, (auth, last_used) = next(iter(self._loaded.items()))
+                if last_used > cutoff:
+                    break
+                del self._loaded[account]
+
+    def refresh_stale_devices(self, dispatcher, accounts=()):
+        """Refetch device lists in the background before they expire.
+
+        Covers every loaded account, plus the given accounts (e.g. those
+        with alarms about to fire), which are loaded if needed so their
+        lists are warm at fire time.
+        """
+        with self._lock:
+            loaded = {id(auth): auth for auth, _ in self._loaded.values()}
+        if self._default is not None:
+            loaded[id(self._default)] = self._default
+        for account in accounts:
+            if not is_valid_account(account):
+                continue  # Its alarms fall back to the browser when they fire
+            auth = self.get(account)
+            loaded[id(auth)] = auth
+        for auth in loaded.values():
+            if auth.is_authenticated() and auth.devices_stale():
+                dispatcher.submit(auth.refresh_devices, DEVICE_REFRESH_AHEAD)
+
+    def loaded_accounts(self):
+        with self._lock:
+            return list(self._loaded)
+
+    def known_accounts(self):
+        """List every account with a credentials file"""
+        accounts = [DEFAULT_ACCOUNT]
+        if os.path.isdir(self.accounts_dir):
+            accounts += sorted(name[:-5] for name in os.listdir(self.accounts_dir)
+                               if name.endswith(".json") and name[:-5] != DEFAULT_ACCOUNT)
+        return accounts
@@ -0,0 +1,112 @@
+import json
+import time
+
+import pytest
+
+from alarm_io import RowError, import_alarms, normalize
+
+URL = "https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC"
+
+
+def run_import(tmp_path, name, content, existing=None, chunk_size=2):
+    source = tmp_path / name
+    source.write_text(content, encoding="utf-8")
+    store = tmp_path / "alarms.json"
+    if existing is not None:
+        store.write_text(json.dumps(existing), encoding="utf-8")
+    errors = []
+    imported, failed = import_alarms(str(source), str(store), chunk_size=chunk_size,
+                                     on_error=errors.append)
+    return imported, failed, errors, json.loads(store.read_text(encoding="utf-8"))
+
+
+def test_csv_row_errors_are_reported_with_line_numbers(tmp_path):
+    content = (
+        "time_str,url,repeat_days,label\n"
+        f"07:00,{URL},Mon;Fri,ok\n"
+        f"25:00,{URL},Mon,bad time\n"
+        "07:30,https://example.com/x,Mon,bad url\n"
+        f"08:00,{URL},Funday,bad day\n"
+        f"09:00,{URL},Once,ok too\n"
+    )
+    imported, failed, errors, store = run_import(tmp_path, "alarms.csv", content)
+    assert (imported, failed) == (2, 3)
+    assert [e.line for e in errors] == [3, 4, 5]
+    assert [a["label"] for a in store] == ["ok", "ok too"]
+    assert store[0]["repeat_days"] == ["Monday", "Friday"]
+
+
+def test_jsonl_bad_json_and_duplicates(tmp_path):
+    existing = [{"id": "keep", "time_str": "06:00", "url": URL, "repeat_days": ["Once"]}]
+    content = "\n".join([
+        json.dumps({"id": "keep", "time": "07:00", "url": URL, "days": "Mon"}),
+        "{not json",
+        json.dumps({"id": 5, "time": "7:05", "url": URL, "days": ["Tue"]}),
+        json.dumps(["not", "an", "object"]),
+    ])
+    imported, failed, errors, store = run_import(tmp_path, "alarms.jsonl", content, existing)
+    assert (imported, failed) == (1, 3)
+    assert sorted(e.line for e in errors) == [1, 2, 4]
+    assert [a["id"] for a in store] == ["keep", "5"]
+    assert store[1]["time_str"] == "07:05"
+
+
+def test_failed_import_leaves_store_untouched(tmp_path):
+    existing = [{"id": "keep", "time_str": "06:00", "url": URL, "repeat_days": ["Once"]}]
+    with pytest.raises(ValueError):
+        run_import(tmp_path, "alarms.txt", "whatever", existing)
+    store = json.loads((tmp_path / "alarms.json").read_text(encoding="utf-8"))
+    assert store == existing
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["alarms.json", "alarms.txt"]
+
+
+@pytest.mark.skipif(not hasattr(time, "tzset"), reason="needs time.tzset")
+def test_utc_dtstart_is_converted_to_local_time(tmp_path, monkeypatch):
+    monkeypatch.setenv("TZ", "Asia/Tokyo")
+    time.tzset()
+    try:
+        content = (
+            "BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\n"
+            "DTSTART:20261019T200000Z\r\n"
+            "RRULE:FREQ=WEEKLY;BYDAY=MO\r\n"
+            f"URL:{URL}\r\n"
+            "END:VEVENT\r\nEND:VCALENDAR\r\n"
+        )
+        imported, _, _, store = run_import(tmp_path, "alarms.ics", content)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    assert imported == 1
+    assert store[0]["time_str"] == "05:00"
+    assert store[0]["repeat_days"] == ["Tuesday"]
+
+
+def test_normalize_rejects_missing_days():
+    with pytest.raises(RowError):
+        normalize(1, {"time": "07:00", "url": URL, "days": ""})
+
+
+@pytest.mark.parametrize("days", [5, {"Mon": True}, [1, 2]])
+def test_normalize_rejects_days_of_the_wrong_type(days):
+    with pytest.raises(RowError):
+        normalize(1, {"time": "07:00", "url": URL, "days": days})
+
+
+@pytest.mark.parametrize("ramp", [
+    [1, 2],
+    '"loud"',
+    {"start": "5"},
+    {"start": 10, "end": 150},
+    {"seconds": 0},
+    {"curve": "sideways"},
+    {"volume": 50},
+])
+def test_normalize_rejects_invalid_ramps(ramp):
+    with pytest.raises(RowError):
+        normalize(1, {"time": "07:00", "url": URL, "days": "Mon", "ramp": ramp})
+
+
+def test_normalize_fills_in_ramp_defaults():
+    alarm = normalize(1, {"time": "07:00", "url": URL, "days": "Mon",
+                          "ramp": '{"start": 5, "curve": "ease-in"}'})
+    assert alarm["ramp"] == {"start": 5, "end": 80, "seconds": 300, "curve": "ease-in"}
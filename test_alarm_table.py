@@ -0,0 +1,122 @@
+from datetime import datetime
+
+import pytest
+
+from alarm_table import NEVER, AlarmTable, load_table
+
+URL = "https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC"
+MONDAY = datetime(2026, 10, 19, 7, 0)  # a Monday
+SUNDAY_LATE = datetime(2026, 10, 25, 23, 59)
+
+
+def make_alarm(time_str="07:00", repeat_days=("Monday",), **extra):
+    alarm = {"time_str": time_str, "url": URL, "repeat_days": list(repeat_days)}
+    alarm.update(extra)
+    return alarm
+
+
+@pytest.fixture
+def table():
+    return AlarmTable.from_dicts([
+        make_alarm("07:00", ["Monday", "Friday"], id="weekday", label="Work"),
+        make_alarm("00:00", ["Monday"], id="midnight", account="bob", device="Kitchen"),
+        make_alarm("07:00", ["Once"], id="once", ramp={"start": 5, "end": 50}),
+        make_alarm("07:00", ["Monday"], id="off", enabled=False),
+    ])
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_snapshot_round_trip(tmp_path, table, use_mmap):
+    path = tmp_path / "alarms.bwt"
+    table.save_snapshot(str(path))
+    loaded = AlarmTable.load_snapshot(str(path), use_mmap=use_mmap)
+    try:
+        assert loaded.to_dicts() == table.to_dicts()
+        assert loaded.alarm_id(1) == "midnight"
+        assert loaded.account(1) == "bob"
+        assert loaded.row(2)["ramp"] == {"start": 5, "end": 50}
+    finally:
+        loaded.close()
+
+
+def test_mapped_table_can_be_extended(tmp_path, table):
+    path = tmp_path / "alarms.bwt"
+    table.save_snapshot(str(path))
+    loaded = AlarmTable.load_snapshot(str(path))
+    loaded.append(make_alarm("08:15", ["Sunday"], id="new"))
+    assert len(loaded) == len(table) + 1
+    assert loaded.row(len(table))["time_str"] == "08:15"
+    assert loaded.to_dicts()[:len(table)] == table.to_dicts()
+
+
+def test_empty_snapshot(tmp_path):
+    path = tmp_path / "empty.bwt"
+    AlarmTable().save_snapshot(str(path))
+    loaded = AlarmTable.load_snapshot(str(path))
+    assert len(loaded) == 0
+    assert loaded.due_now(MONDAY) == []
+    assert list(loaded.next_fire(MONDAY)) == []
+    loaded.close()
+
+
+def test_rejects_foreign_snapshot(tmp_path):
+    path = tmp_path / "bogus.bwt"
+    path.write_bytes(b"not a snapshot at all" * 10)
+    with pytest.raises(ValueError):
+        AlarmTable.load_snapshot(str(path))
+
+
+def test_due_now(table):
+    assert table.due_now(MONDAY) == [0, 2]
+    assert table.due_now(MONDAY.replace(hour=0)) == [1]
+    # Tuesday: only the Once alarm fires at 07:00
+    assert table.due_now(datetime(2026, 10, 20, 7, 0)) == [2]
+
+
+def test_next_fire_around_midnight(table):
+    minutes = table.next_fire(SUNDAY_LATE)
+    assert minutes[1] == 1  # Monday 00:00 is one minute away
+    assert minutes[0] == 7 * 60 + 1
+    assert minutes[2] == 7 * 60 + 1  # Once fires at its next occurrence
+    assert minutes[3] == NEVER
+
+
+def test_next_fire_after_todays_time(table):
+    minutes = table.next_fire(MONDAY.replace(minute=1))
+    assert minutes[0] == 4 * 24 * 60 - 1  # Friday 07:00
+    assert minutes[1] == 7 * 24 * 60 - 7 * 60 - 1  # next Monday 00:00
+    assert minutes[2] == 24 * 60 - 1  # Once: tomorrow 07:00
+
+
+def test_identical_legacy_alarms_get_distinct_ids():
+    table = AlarmTable.from_dicts([make_alarm(), make_alarm()])
+    assert table.alarm_id(0) != table.alarm_id(1)
+
+
+def test_load_table_persists_ids_and_rebuilds_snapshot(tmp_path):
+    json_path = tmp_path / "alarms.json"
+    snapshot_path = tmp_path / "alarms.bwt"
+    json_path.write_text('[{"time_str": "07:00", "url": "%s", "repeat_days": ["Once"]},'
+                         ' {"time_str": "07:00", "url": "%s", "repeat_days": ["Once"]}]' % (URL, URL))
+    table = load_table(str(json_path), str(snapshot_path))
+    ids = [table.alarm_id(0), table.alarm_id(1)]
+    assert ids[0] != ids[1]
+    assert snapshot_path.exists()
+
+    again = load_table(str(json_path), str(snapshot_path))
+    assert [again.alarm_id(0), again.alarm_id(1)] == ids
+    again.close()
+
+
+def test_malformed_alarms_are_skipped_and_reported():
+    errors = []
+    table = AlarmTable.from_dicts([
+        make_alarm("7am", id="bad-time"),
+        {"id": "no-url", "time_str": "07:00", "repeat_days": ["Monday"]},
+        make_alarm("07:00", id="good"),
+        dict(make_alarm("07:00", id="bad-days"), repeat_days=None),
+    ], on_error=errors.append)
+    assert len(table) == 1
+    assert table.alarm_id(0) == "good"
+    assert len(errors) == 3
+    assert all(len(getattr(table, name)) == 1 for name in ("minutes", "url_idx", "id_idx"))
@@ -0,0 +1,63 @@
+import threading
+
+import audio
+from audio import AudioPlayer, Sound, decode_sound
+
+
+def test_decoded_sounds_are_cached_as_wav(tmp_path, monkeypatch):
+    source = tmp_path / "ring.oga"
+    source.write_bytes(b"OggS not really")
+    calls = []
+
+    def fake_decoder(path):
+        calls.append(path)
+        return Sound(b"\x01\x00\x02\x00" * 10, 44100, 2, 2)
+
+    monkeypatch.setattr(audio, "run_decoder", fake_decoder)
+    cache_dir = tmp_path / "sound_cache"
+    first = decode_sound(str(source), str(cache_dir))
+    second = decode_sound(str(source), str(cache_dir))
+    assert len(calls) == 1
+    assert second.pcm == first.pcm
+    assert second.format == (44100, 2, 2)
+    assert [p.suffix for p in cache_dir.iterdir()] == [".wav"]
+
+
+def test_undecodable_sound_uses_the_builtin_beep(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio, "run_decoder", lambda path: None)
+    config = tmp_path / "audio_config.json"
+    config.write_text('{"alarm": "%s"}' % (tmp_path / "missing.oga"))
+    player = AudioPlayer(str(config))
+    try:
+        sound = player._sound("alarm")
+        assert sound.format == (audio.DECODE_RATE, audio.DECODE_CHANNELS, 2)
+        assert any(sound.pcm)
+    finally:
+        player.close()
+
+
+def test_queued_sound_is_not_queued_twice(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    played = []
+
+    def slow_write(self, sound, repeat):
+        played.append(repeat)
+        started.set()
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr(AudioPlayer, "_write", slow_write)
+    monkeypatch.setattr(AudioPlayer, "_sound", lambda self, name: None)
+    player = AudioPlayer()
+    try:
+        assert player.play("alarm")
+        started.wait(5)  # the first request is playing, no longer pending
+        assert player.play("alarm", 2)
+        assert not player.play("alarm", 3)
+        assert player.play("fallback")
+        release.set()
+    finally:
+        player.close()
+    assert played[:2] == [1, 2]
+    assert 3 not in played
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from coordination import Coordinator, shard_for
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "coord.db")
+
+
+def test_claim_fire_is_exactly_once(db_path):
+    nodes = [Coordinator(db_path, node_id=f"node-{i}") for i in range(4)]
+    results = []
+    barrier = threading.Barrier(len(nodes))
+
+    def claim(node):
+        barrier.wait()
+        results.append(node.claim_fire("alarm-1", "2026-10-19 07:00"))
+
+    threads = [threading.Thread(target=claim, args=(node,)) for node in nodes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [False, False, False, True]
+    # A different scheduled instant is a new fire
+    assert nodes[0].claim_fire("alarm-1", "2026-10-20 07:00")
+    for node in nodes:
+        node.conn.close()
+
+
+def test_prune_fires_forgets_old_claims(db_path):
+    node = Coordinator(db_path, node_id="a")
+    assert node.claim_fire("alarm-1", "2026-10-19 07:00")
+    node.prune_fires(retention=-1)
+    assert node.claim_fire("alarm-1", "2026-10-19 07:00")
+    node.conn.close()
+
+
+def test_shards_are_split_between_live_nodes(db_path):
+    a = Coordinator(db_path, node_id="a", num_shards=8)
+    b = Coordinator(db_path, node_id="b", num_shards=8)
+    a.heartbeat()
+    b.heartbeat()
+    owned_a = a.heartbeat()
+    owned_b = b.heartbeat()
+    assert owned_a.isdisjoint(owned_b)
+    assert len(owned_a) == len(owned_b) == 4
+    assert a.owns("x") != b.owns("x")
+    assert shard_for("x", 8) in (owned_a | owned_b)
+    a.conn.close()
+    b.conn.close()
@@ -0,0 +1,47 @@
+import os
+
+from fire_journal import PATH_SOUND, PATH_SPOTIFY, FireJournal
+
+
+def test_writers_sharing_a_directory_see_each_other(tmp_path):
+    gui = FireJournal(str(tmp_path), flush_interval=0.01)
+    daemon = FireJournal(str(tmp_path), flush_interval=0.01)
+    gui.record("gui-alarm", "2026-10-19 07:00", PATH_SOUND)
+    daemon.record("daemon-alarm", "2026-10-19 07:00", PATH_SPOTIFY)
+    gui.flush()
+    daemon.flush()
+    for journal in (gui, daemon):
+        assert {e["alarm_id"] for e in journal.query()} == {"gui-alarm", "daemon-alarm"}
+        assert [e["path"] for e in journal.query(alarm_id="daemon-alarm")] == [PATH_SPOTIFY]
+    gui.close()
+    daemon.close()
+
+
+def test_rotation_keeps_newest_segments(tmp_path):
+    journal = FireJournal(str(tmp_path), max_bytes=1000, max_segments=3, flush_interval=0.01)
+    for i in range(100):
+        journal.record(f"alarm-{i}", "", PATH_SOUND)
+    journal.flush()
+    segments = sorted(n for n in os.listdir(tmp_path) if n.endswith(".jsonl"))
+    assert len(segments) == 3
+    entries = journal.query()
+    assert entries[0]["alarm_id"] == "alarm-99"
+    assert journal.query(limit=5) == entries[:5]
+    assert journal.query(start_day="2999-01-01") == []
+    journal.close()
+
+
+def test_unindexed_tail_is_recovered(tmp_path):
+    journal = FireJournal(str(tmp_path), flush_interval=0.01)
+    journal.record("indexed", "", PATH_SOUND)
+    journal.flush()
+    journal.close()
+    segment = next(n for n in os.listdir(tmp_path) if n.endswith(".jsonl"))
+    with open(tmp_path / segment, "ab") as f:
+        f.write(b'{"alarm_id":"crashed","actual":"2026-10-19T07:00:00","path":"sound"}\n{"alar')
+
+    reopened = FireJournal(str(tmp_path), flush_interval=0.01)
+    reopened.record("after", "", PATH_SOUND)
+    reopened.flush()
+    assert [e["alarm_id"] for e in reopened.query()] == ["after", "crashed", "indexed"]
+    reopened.close()
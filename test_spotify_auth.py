@@ -0,0 +1,168 @@
+import threading
+import urllib.request
+from urllib.error import HTTPError
+
+import pytest
+
+from spotify_auth import CALLBACK_PATH, CallbackServer, SpotifyAuth
+
+
+class InlineDispatcher:
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+class StubLoginAuth:
+    def __init__(self):
+        self.codes = []
+
+    def exchange_code(self, code):
+        self.codes.append(code)
+        return True
+
+
+@pytest.fixture
+def server():
+    server = CallbackServer(host="127.0.0.1", port=0, dispatcher=InlineDispatcher())
+    yield server
+    server.stop()
+
+
+def test_callbacks_are_routed_by_state(server):
+    alice, bob = StubLoginAuth(), StubLoginAuth()
+    results = {}
+    alice_state = server.register(alice, lambda ok: results.setdefault("alice", ok))
+    bob_state = server.register(bob, lambda ok: results.setdefault("bob", ok))
+
+    status, _ = server.handle_callback({"state": [bob_state], "code": ["bob-code"]})
+    assert status == 200
+    assert bob.codes == ["bob-code"] and alice.codes == []
+    assert results == {"bob": True}
+    assert list(server.pending) == [alice_state]
+
+
+def test_unknown_or_reused_state_is_rejected(server):
+    state = server.register(StubLoginAuth(), lambda ok: None)
+    assert server.handle_callback({"state": ["forged"], "code": ["x"]})[0] == 400
+    assert server.handle_callback({"code": ["x"]})[0] == 400
+    assert server.handle_callback({"state": [state], "code": ["x"]})[0] == 200
+    assert server.handle_callback({"state": [state], "code": ["x"]})[0] == 400
+
+
+def test_missing_code_fails_the_login(server):
+    results = []
+    state = server.register(StubLoginAuth(), results.append)
+    status, message = server.handle_callback({"state": [state], "error": ["access_denied"]})
+    assert status == 400
+    assert "access_denied" in message
+    assert results == [False]
+    assert not server.pending
+
+
+def test_pending_login_expires(server):
+    expired = threading.Event()
+    results = []
+
+    def callback(ok):
+        results.append(ok)
+        expired.set()
+
+    state = server.register(StubLoginAuth(), callback, timeout=0.05)
+    assert expired.wait(5)
+    assert results == [False]
+    assert server.handle_callback({"state": [state], "code": ["late"]})[0] == 400
+
+
+def test_callback_page_escapes_the_error(server):
+    server.start()
+    port = server.server.server_address[1]
+    state = server.register(StubLoginAuth(), lambda ok: None)
+    url = f"http://127.0.0.1:{port}{CALLBACK_PATH}?state={state}&error=%3Cscript%3E"
+    with pytest.raises(HTTPError) as failure:
+        urllib.request.urlopen(url, timeout=5)
+    page = failure.value.read().decode()
+    assert failure.value.code == 400
+    assert "<script>" not in page and "&lt;script&gt;" in page
+
+
+DEVICES = [
+    {"id": "phone", "name": "Phone", "is_active": False},
+    {"id": "kitchen", "name": "Kitchen Speaker", "is_active": True},
+]
+
+
+class StubResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+
+    def json(self):
+        return self.body
+
+
+class DeviceSession:
+    def __init__(self, devices=DEVICES):
+        self.devices = devices
+        self.calls = 0
+
+    def get(self, url, headers=None):
+        self.calls += 1
+        return StubResponse(200, {"devices": self.devices})
+
+
+def make_auth(tmp_path, session):
+    auth = SpotifyAuth(str(tmp_path / "spotify.json"), session=session)
+    auth.access_token = "token"
+    return auth
+
+
+def test_pick_device(tmp_path):
+    auth = make_auth(tmp_path, DeviceSession())
+    assert auth.pick_device("kitchen speaker")["id"] == "kitchen"
+    assert auth.pick_device("phone")["id"] == "phone"
+    assert auth.pick_device("Garage")["id"] == "kitchen"  # unknown: the active one
+    assert auth.pick_device()["id"] == "kitchen"
+    assert auth.session.calls == 1  # the fire path reuses the cached list
+
+    idle = make_auth(tmp_path, DeviceSession([dict(d, is_active=False) for d in DEVICES]))
+    assert idle.pick_device()["id"] == "phone"
+    assert make_auth(tmp_path, DeviceSession([])).pick_device() is None
+
+
+def test_refresh_devices_reuses_a_young_list(tmp_path):
+    auth = make_auth(tmp_path, DeviceSession())
+    assert auth.devices_stale()
+    assert auth.refresh_devices(max_age=30)
+    assert auth.refresh_devices(max_age=30)
+    assert auth.session.calls == 1
+    assert not auth.devices_stale()
+
+    auth.devices_fetched_at -= 45
+    assert auth.devices_stale()
+    assert auth.get_devices() == DEVICES  # still within the cache TTL
+    assert auth.session.calls == 1
+    assert auth.refresh_devices(max_age=30)
+    assert auth.session.calls == 2
+
+
+def test_concurrent_refreshes_share_one_fetch(tmp_path):
+    session = DeviceSession()
+    auth = make_auth(tmp_path, session)
+    barrier = threading.Barrier(8)
+
+    def refresh():
+        barrier.wait()
+        auth.refresh_devices(max_age=30)
+
+    threads = [threading.Thread(target=refresh) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert session.calls == 1
+
+
+def test_refresh_devices_needs_a_token(tmp_path):
+    auth = SpotifyAuth(str(tmp_path / "spotify.json"), session=DeviceSession())
+    assert not auth.refresh_devices()
+    assert auth.session.calls == 0
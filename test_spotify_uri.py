@@ -0,0 +1,125 @@
+import pytest
+
+from spotify_auth import SpotifyAuth
+from spotify_uri import MetadataCache, play_payload, resolve
+
+TRACK_ID = "4uLU6hMCjMI75M1A2tKUQC"
+PLAYLIST_ID = "37i9dQZF1DXcBWIGoYBM5M"
+
+
+@pytest.mark.parametrize("url, kind, item_id", [
+    (f"https://open.spotify.com/track/{TRACK_ID}", "track", TRACK_ID),
+    (f"https://open.spotify.com/intl-de/track/{TRACK_ID}?si=abc", "track", TRACK_ID),
+    (f"https://open.spotify.com/intl-pt-br/album/{TRACK_ID}", "album", TRACK_ID),
+    (f"https://open.spotify.com/embed/playlist/{PLAYLIST_ID}", "playlist", PLAYLIST_ID),
+    (f"https://open.spotify.com/user/someone/playlist/{PLAYLIST_ID}", "playlist", PLAYLIST_ID),
+    (f"spotify:episode:{TRACK_ID}", "episode", TRACK_ID),
+    (f"spotify:user:someone:playlist:{PLAYLIST_ID}", "playlist", PLAYLIST_ID),
+])
+def test_resolve(url, kind, item_id):
+    parsed = resolve(url)
+    assert (parsed.kind, parsed.id) == (kind, item_id)
+    assert parsed.uri == f"spotify:{kind}:{item_id}"
+
+
+@pytest.mark.parametrize("url", [
+    "",
+    "https://open.spotify.com/track/tooshort",
+    f"https://open.spotify.com/track/{TRACK_ID}x",
+    f"https://open.spotify.com/podcast/{TRACK_ID}",
+    f"https://example.com/track/{TRACK_ID}",
+    f"spotify:track:{TRACK_ID[:-1]}!",
+])
+def test_resolve_rejects_bad_urls(url):
+    assert resolve(url) is None
+
+
+def test_play_payload():
+    assert play_payload(f"spotify:track:{TRACK_ID}") == {"uris": [f"spotify:track:{TRACK_ID}"]}
+    assert play_payload(f"https://open.spotify.com/episode/{TRACK_ID}") == \
+        {"uris": [f"spotify:episode:{TRACK_ID}"]}
+    assert play_payload(f"https://open.spotify.com/playlist/{PLAYLIST_ID}") == \
+        {"context_uri": f"spotify:playlist:{PLAYLIST_ID}"}
+    assert play_payload("spotify:local:whatever") == {"uris": ["spotify:local:whatever"]}
+
+
+def test_playability_is_kept_per_account(tmp_path):
+    uri = f"spotify:track:{TRACK_ID}"
+    cache = MetadataCache(str(tmp_path / "metadata.json"))
+    cache.put(uri, {"name": "Song", "duration_ms": 1000, "playable": True}, "alice")
+    cache.put(uri, {"name": None, "duration_ms": None, "playable": False}, "bob")
+    assert cache.is_playable(uri, "alice")
+    assert not cache.is_playable(uri, "bob")
+    assert cache.is_playable(uri, "carol")  # never checked: assume it plays
+    assert cache.get(uri)["name"] == "Song"
+    assert cache.is_fresh(uri, "alice") and not cache.is_fresh(uri, "carol")
+
+    cache.save()
+    reloaded = MetadataCache(str(tmp_path / "metadata.json"))
+    assert not reloaded.is_playable(uri, "bob")
+
+
+def test_expired_entries_are_refetched(tmp_path):
+    uri = f"spotify:track:{TRACK_ID}"
+    cache = MetadataCache(str(tmp_path / "metadata.json"), ttl=60)
+    cache.put(uri, {"name": "Song", "playable": False}, "alice")
+    cache.entries[uri]["fetched_at"] -= 120
+    cache.entries[uri]["playable"]["alice"][1] -= 120
+    assert not cache.is_fresh(uri, "alice")
+    assert cache.is_playable(uri, "alice")  # stale "unplayable" is not trusted
+
+    class Auth:
+        calls = 0
+
+        def is_authenticated(self):
+            return True
+
+        def get_metadata(self, uri):
+            Auth.calls += 1
+            return {"name": "Song", "duration_ms": 1000, "playable": True}
+
+    cache.lookup(Auth(), uri, "alice")
+    cache.lookup(Auth(), uri, "alice")
+    assert Auth.calls == 1
+    assert cache.is_fresh(uri, "alice")
+
+
+class StubResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+
+    def json(self):
+        return self.body
+
+
+class StubSession:
+    def __init__(self, response):
+        self.response = response
+        self.urls = []
+
+    def get(self, url, headers=None):
+        self.urls.append(url)
+        return self.response
+
+
+def make_auth(tmp_path, response):
+    auth = SpotifyAuth(str(tmp_path / "spotify.json"), session=StubSession(response))
+    auth.access_token = "token"
+    return auth
+
+
+def test_get_metadata_fetches_only_playlist_names(tmp_path):
+    auth = make_auth(tmp_path, StubResponse(200, {"name": "Morning"}))
+    meta = auth.get_metadata(f"https://open.spotify.com/playlist/{PLAYLIST_ID}")
+    assert meta["name"] == "Morning"
+    assert auth.session.urls == [f"https://api.spotify.com/v1/playlists/{PLAYLIST_ID}?fields=name"]
+
+    assert auth.get_metadata(f"https://open.spotify.com/show/{TRACK_ID}")["playable"]
+    assert len(auth.session.urls) == 1  # shows aren't fetched
+
+
+def test_get_metadata_marks_missing_items_unplayable(tmp_path):
+    auth = make_auth(tmp_path, StubResponse(404))
+    assert auth.get_metadata(f"spotify:track:{TRACK_ID}")["playable"] is False
+    assert auth.session.urls[0].endswith("?market=from_token")
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from tenants import SpotifyAuthPool
+
+
+class NoSession:
+    def get(self, *args, **kwargs):
+        raise AssertionError("no network in tests")
+
+
+@pytest.fixture
+def pool(tmp_path):
+    default = tmp_path / "spotify_config.json"
+    default.write_text(json.dumps({"client_id": "app-id", "client_secret": "app-secret"}))
+    accounts = tmp_path / "accounts"
+    accounts.mkdir()
+    return SpotifyAuthPool(str(accounts), default_config_path=str(default), session=NoSession())
+
+
+def test_tenants_inherit_but_never_save_app_credentials(pool, tmp_path):
+    auth = pool.get("alice")
+    assert (auth.client_id, auth.client_secret) == ("app-id", "app-secret")
+    auth.access_token = "alice-token"
+    auth.save_config()
+    saved = json.loads((tmp_path / "accounts" / "alice.json").read_text())
+    assert saved["access_token"] == "alice-token"
+    assert saved["client_id"] is None and saved["client_secret"] is None
+
+
+def test_tenant_with_its_own_app_keeps_it(pool, tmp_path):
+    auth = pool.get("bob")
+    auth.set_credentials("bob-id", "bob-secret")
+    saved = json.loads((tmp_path / "accounts" / "bob.json").read_text())
+    assert saved["client_id"] == "bob-id"
+
+
+def test_idle_accounts_are_evicted(pool):
+    pool.idle_timeout = 60
+    alice = pool.get("alice")
+    bob = pool.get("bob")
+    pool._loaded["alice"] = (alice, pool._loaded["alice"][1] - 120)
+    pool.evict_idle()
+    assert pool.loaded_accounts() == ["bob"]
+    assert pool.get("bob") is bob
+    assert pool.get("alice") is not alice  # reloaded from disk
+
+
+def test_loaded_accounts_are_bounded_lru(pool):
+    pool.max_loaded = 2
+    pool.get("alice")
+    pool.get("bob")
+    pool.get("alice")  # bob is now least recently used
+    pool.get("carol")
+    assert pool.loaded_accounts() == ["alice", "carol"]
+    default = pool.get()
+    pool.get("dave")
+    assert pool.get() is default  # the default account is pinned
+
+
+@pytest.mark.parametrize("account", ["a/b", "../x", ".hidden", "a\\\\b"])
+def test_unsafe_account_names_are_rejected(pool, account):
+    with pytest.raises(ValueError):
+        pool.get(account)
+
+
+def test_refresh_skips_unsafe_account_names(pool):
+    class Dispatcher:
+        submitted = []
+
+        def submit(self, fn, *args):
+            self.submitted.append(fn)
+
+    pool.refresh_stale_devices(Dispatcher(), {"../x"})
+    assert Dispatcher.submitted == []
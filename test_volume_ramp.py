@@ -0,0 +1,64 @@
+import threading
+import time
+
+from volume_ramp import RampScheduler, ramp_volume
+
+
+class ImmediateDispatcher:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class SlowAuth:
+    """Records set_volume calls; each call blocks until released"""
+
+    def __init__(self):
+        self.volumes = []
+        self.release = threading.Event()
+
+    def set_volume(self, volume, device_id=None):
+        self.volumes.append(volume)
+        self.release.wait()
+        return True
+
+
+def test_ramp_volume_curves():
+    spec = {"start": 10, "end": 90, "seconds": 100}
+    assert ramp_volume(spec, 0) == 10
+    assert ramp_volume(spec, 50) == 50
+    assert ramp_volume(spec, 500) == 90
+    assert ramp_volume(dict(spec, curve="ease-in"), 50) == 30
+
+
+def test_steps_coalesce_while_a_call_is_in_flight():
+    auth = SlowAuth()
+    dispatcher = type("Threaded", (), {
+        "submit": lambda self, fn, *args: threading.Thread(target=fn, args=args, daemon=True).start()
+    })()
+    scheduler = RampScheduler(dispatcher, tick=3600, report=lambda message: None)
+    ramp = scheduler.start("a", auth, {"start": 0, "end": 100, "seconds": 10}, device_id="d")
+    time.sleep(0.1)  # first step is sent and blocks
+
+    for elapsed in (2, 4, 6):
+        ramp.started = time.monotonic() - elapsed
+        scheduler._step()
+    assert auth.volumes == [0]
+    assert ramp.coalesced == 2  # 20 and 40 replaced by 60 before being sent
+
+    auth.release.set()
+    time.sleep(0.1)
+    assert auth.volumes == [0, 60]
+
+
+def test_finished_ramp_reports_its_stats():
+    reports = []
+    auth = SlowAuth()
+    auth.release.set()
+    scheduler = RampScheduler(ImmediateDispatcher(), tick=3600, report=reports.append)
+    ramp = scheduler.start("a", auth, {"start": 10, "end": 20, "seconds": 1}, device_id="d")
+    ramp.started -= 5
+    scheduler._step()
+    scheduler._step()
+    assert auth.volumes == [20]
+    assert scheduler.stats()[0]["calls"] == 1
+    assert reports and "finished" in reports[0]
@@ -0,0 +1,171 @@
+"""BeatWake volume ramps - gentle wake-up volume curves with coalesced API calls"""
+
+import threading
+import time
+
+DEFAULT_RAMP = {"start": 10, "end": 80, "seconds": 300, "curve": "linear"}
+TICK_SECONDS = 1.0
+MIN_STEP = 2  # percent; smaller changes are not worth an API call
+
+CURVES = {
+    "linear": lambda x: x,
+    # Loudness is perceived roughly logarithmically, so rise slowly at first
+    "ease-in": lambda x: x * x,
+}
+
+
+def ramp_volume(spec, elapsed):
+    """Volume (0-100) a ramp asks for after elapsed seconds"""
+    seconds = max(float(spec.get("seconds", DEFAULT_RAMP["seconds"])), 1.0)
+    start = spec.get("start", DEFAULT_RAMP["start"])
+    end = spec.get("end", DEFAULT_RAMP["end"])
+    curve = CURVES.get(spec.get("curve", "linear"), CURVES["linear"])
+    progress = min(max(elapsed / seconds, 0.0), 1.0)
+    return max(0, min(100, round(start + (end - start) * curve(progress))))
+
+
+class Ramp:
+    """One alarm's volume ramp and its API call counts"""
+
+    def __init__(self, alarm_id, auth, device_id, spec, label=""):
+        self.alarm_id = alarm_id
+        self.auth = auth
+        self.device_id = device_id
+        self.spec = spec
+        self.label = label
+        self.started = time.monotonic()
+        self.last_target = None
+        self.calls = 0
+        self.failures = 0
+        self.coalesced = 0  # steps replaced by a newer one before being sent
+        self.cancelled = False
+        self.done = False
+
+    @property
+    def device_key(self):
+        return (id(self.auth), self.device_id)
+
+    def stats(self):
+        return {
+            "alarm_id": self.alarm_id,
+            "label": self.label,
+            "calls": self.calls,
+            "failures": self.failures,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
+
+
+class RampScheduler:
+    """Drives every active ramp from one timer thread.
+
+    Each tick computes every ramp's target volume. Targets are coalesced
+    per device so only the latest one is sent, and a device with a call
+    still in flight is skipped until that call returns. Calls run on the
+    shared dispatcher, never on the scheduler thread.
+    """
+
+    def __init__(self, dispatcher, tick=TICK_SECONDS, report=print):
+        self.dispatcher = dispatcher
+        self.tick = tick
+        self.report = report
+        self.ramps = {}  # alarm_id -> Ramp
+        self.pending = {}  # device key -> (Ramp, volume)
+        self.in_flight = set()  # device keys
+        self.finished = []  # stats of completed ramps
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def start(self, alarm_id, auth, spec, device_id=None, label=""):
+        """Begin ramping an alarm's volume, replacing any ramp it already has"""
+        spec = dict(DEFAULT_RAMP, **(spec or {}))
+        ramp = Ramp(alarm_id, auth, device_id, spec, label)
+        with self._lock:
+            previous = self.ramps.get(alarm_id)
+            if previous is not None:
+                self._finish(previous, cancelled=True)
+            # Another alarm ramping the same device gives way to the new one
+            for other in list(self.ramps.values()):
+                if other.device_key == ramp.device_key:
+                    self._finish(other, cancelled=True)
+            self.ramps[alarm_id] = ramp
+        self._wake.set()
+        return ramp
+
+    def cancel(self, alarm_id):
+        """Stop an alarm's ramp (e.g. on snooze); returns True if one was running"""
+        with self._lock:
+            ramp = self.ramps.get(alarm_id)
+            if ramp is None:
+                return False
+            self._finish(ramp, cancelled=True)
+            return True
+
+    def stats(self):
+        """Call counts of running and finished ramps"""
+        with self._lock:
+            return [r.stats() for r in self.ramps.values()] + list(self.finished)
+
+    def _finish(self, ramp, cancelled=False):
+        # Caller holds self._lock
+        ramp.cancelled = cancelled
+        ramp.done = True
+        self.ramps.pop(ramp.alarm_id, None)
+        pending = self.pending.get(ramp.device_key)
+        if pending is not None and pending[0] is ramp:
+            del self.pending[ramp.device_key]
+        stats = ramp.stats()
+        self.finished.append(stats)
+        del self.finished[:-100]
+        self.report(f"Volume ramp {'cancelled' if cancelled else 'finished'} for "
+                    f"{ramp.label or ramp.alarm_id}: {ramp.calls} calls, "
+                    f"{ramp.coalesced} steps coalesced, {ramp.failures} failed")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.tick)
+            self._wake.clear()
+            self._step()
+
+    def _step(self):
+        now = time.monotonic()
+        to_send = []
+        with self._lock:
+            for ramp in list(self.ramps.values()):
+                elapsed = now - ramp.started
+                target = ramp_volume(ramp.spec, elapsed)
+                complete = elapsed >= float(ramp.spec["seconds"])
+                last = ramp.last_target
+                if last is None or abs(target - last) >= MIN_STEP or (complete and target != last):
+                    queued = self.pending.get(ramp.device_key)
+                    if queued is not None and queued[0] is ramp:
+                        ramp.coalesced += 1
+                    self.pending[ramp.device_key] = (ramp, target)
+                    ramp.last_target = target
+                if complete and ramp.device_key not in self.pending \
+                        and ramp.device_key not in self.in_flight:
+                    self._finish(ramp)
+
+            for key, (ramp, volume) in list(self.pending.items()):
+                if key in self.in_flight:
+                    continue  # Latest target waits for the running call
+                del self.pending[key]
+                self.in_flight.add(key)
+                to_send.append((ramp, volume))
+
+        for ramp, volume in to_send:
+            self.dispatcher.submit(self._send, ramp, volume)
+
+    def _send(self, ramp, volume):
+        try:
+            ok = ramp.auth.set_volume(volume, ramp.device_id)
+        except Exception:
+            ok = False
+        with self._lock:
+            self.in_flight.discard(ramp.device_key)
+            ramp.calls += 1
+            if not ok:
+                ramp.failures += 1
+        self._wake.set()